@@ -0,0 +1,42 @@
+from fastapi import APIRouter, HTTPException
+from models.schemas import DedupRequest
+from services import ollama_client
+from core.config import DEDUP_THRESHOLD, DEDUP_COSINE_THRESHOLD
+from utils.dedup import find_duplicate_clusters
+import asyncio
+import logging
+
+router = APIRouter(prefix="/api/dedup-questions", tags=["dedup"])
+
+@router.post("/")
+async def dedup_questions(request: DedupRequest):
+    try:
+        embeddings = None
+        if request.use_embeddings:
+            slots = asyncio.Semaphore(ollama_client.capacity() * 4)
+
+            async def embed(text):
+                async with slots:
+                    return await ollama_client.embeddings(text)
+
+            embeddings = await asyncio.gather(*(embed(q) for q in request.questions))
+
+        clusters = await asyncio.to_thread(
+            find_duplicate_clusters,
+            request.questions,
+            threshold=request.threshold or DEDUP_THRESHOLD,
+            embeddings=embeddings,
+            cosine_threshold=DEDUP_COSINE_THRESHOLD
+        )
+        return {
+            "status": "success",
+            "total_questions": len(request.questions),
+            "duplicate_clusters": [
+                {"keep": cluster[0], "duplicates": cluster[1:], "questions": [request.questions[i] for i in cluster]}
+                for cluster in clusters
+            ],
+            "duplicates": sum(len(cluster) - 1 for cluster in clusters)
+        }
+    except Exception as e:
+        logging.error(f"Error in dedup_questions: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error detecting duplicates: {str(e)}")
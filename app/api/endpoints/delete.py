@@ -1,8 +1,16 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, HTTPException, BackgroundTasks
 from pydantic import BaseModel
 from models.schemas import DeleteResponse
-from services.neo4j_operations import delete_data_from_neo4j  # Import the function
-from core.dependencies import get_graph
+from services import neo4j_operations
+from services.neo4j_operations import delete_data_from_neo4j, collect_orphan_entities
+from services.question_pool import question_pool
+from services.file_catalog import file_catalog
+from services.semantic_cache import semantic_cache
+from core.config import UPLOAD_DIR
+import asyncio
+import os
+from core.dependencies import get_graph, RETRIEVER_DATABASES
+from utils.helpers import upload_key
 import logging
 
 class DeleteRequest(BaseModel):
@@ -11,24 +19,68 @@ class DeleteRequest(BaseModel):
 
 router = APIRouter(prefix="/api/delete-file", tags=["delete"])
 
+def delete_chunks(filename: str):
+    """Delete a file's chunks from its language database; returns summed counts and (graph, entity ids) to collect.
+
+    Files the catalog has no language for (unknown or imported from the top of UPLOAD_DIR)
+    are deleted from every language database.
+    """
+    row = file_catalog.get(filename)
+    languages = [row["language"]] if row and row["language"] != "unknown" else list(RETRIEVER_DATABASES)
+    counts, orphan_candidates = {"nodes_deleted": 0, "relationships_deleted": 0}, []
+    for language in languages:
+        graph = get_graph(language)
+        result = delete_data_from_neo4j(filename, graph)
+        counts["nodes_deleted"] += result["nodes_deleted"]
+        counts["relationships_deleted"] += result["relationships_deleted"]
+        if result["mentioned_entities"]:
+            orphan_candidates.append((graph, result["mentioned_entities"]))
+        semantic_cache.bump_version(row["collection"] if row else None, language)
+    return counts, orphan_candidates
+
+def remove_file_records(filename: str, delete_file: bool):
+    question_pool.delete_document(filename)
+    if delete_file:
+        file_path = os.path.join(UPLOAD_DIR, filename)
+        if os.path.exists(file_path):
+            os.remove(file_path)
+        file_catalog.remove(filename)
+    else:
+        file_catalog.mark_deleted(filename)
+
 @router.post("/", response_model=DeleteResponse)
-async def delete_data(request: DeleteRequest, graph=Depends(get_graph)):
+async def delete_data(request: DeleteRequest, background_tasks: BackgroundTasks):
     try:
-        logging.info(f"Delete request received for: {request.filename}")
+        filename = upload_key(request.filename)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        logging.info(f"Delete request received for: {filename}")
         
-        deleted_count = delete_data_from_neo4j(request.filename, graph)
+        # One key for the graph, the question pool, the catalog and the file on disk.
+        # Neo4j, SQLite and file removal all block; run them off the event loop.
+        counts, orphan_candidates = await asyncio.to_thread(delete_chunks, filename)
+        await asyncio.to_thread(remove_file_records, filename, request.delete_file)
+        for graph, entity_ids in orphan_candidates:
+            background_tasks.add_task(collect_orphan_entities, entity_ids, graph, filename)
         
-        if deleted_count == 0:
-            logging.warning(f"No nodes found for deletion with keyword: {request.filename}")
+        if counts["nodes_deleted"] == 0:
+            logging.warning(f"No chunks found for deletion from file: {filename}")
             return DeleteResponse(
-                message=f"No nodes found matching '{request.filename}'", 
+                message=f"No chunks found for '{filename}'", 
                 deleted_nodes=0
             )
         
         return DeleteResponse(
-            message=f"Successfully deleted {deleted_count} nodes related to '{request.filename}'", 
-            deleted_nodes=deleted_count
+            message=f"Successfully deleted {counts['nodes_deleted']} chunks ingested from '{filename}'", 
+            deleted_nodes=counts["nodes_deleted"],
+            deleted_relationships=counts["relationships_deleted"]
         )
     except Exception as e:
         logging.error(f"Error during deletion: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Error during deletion: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Error during deletion: {str(e)}")
+
+@router.get("/gc")
+async def last_gc():
+    """Entities and relationships reclaimed by the most recent orphan collection."""
+    return neo4j_operations.last_gc_report
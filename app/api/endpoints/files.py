@@ -1,28 +1,98 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Query, Request, HTTPException
+from fastapi.responses import Response
+from urllib.parse import quote
+import asyncio
+import hashlib
 import os
 from core.config import UPLOAD_DIR
+from services.file_catalog import file_catalog
+from utils.file_response import RangeFileResponse, RangeNotSatisfiable, parse_range
 
 router = APIRouter(prefix="/api/files", tags=["files"])
 
 @router.get("/")
-async def list_files():
-    response = []
-    for root, dirs, files in os.walk(UPLOAD_DIR):
-        for file in files:
-            if file.endswith('.pdf'):
-                relative_path = os.path.relpath(root, UPLOAD_DIR)
-                language = relative_path.split(os.sep)[0] if relative_path != "." else "unknown"
-
-                response.append({
-                    "title": os.path.splitext(file)[0],
-                    "url_file": f"/{relative_path}/{file}".replace("\\", "/"),
-                    "language": language
-                })
+async def list_files(
+    language: str = Query(None),
+    collection: str = Query(None),
+    status: str = Query(None, description="ingesting, ingested, failed, deleted or unknown"),
+    search: str = Query(None, description="Substring of the file title"),
+    page: int = Query(1, ge=1),
+    page_size: int = Query(50, ge=1, le=500)
+):
+    total, rows = await asyncio.to_thread(
+        file_catalog.list, language, collection, status, search, (page - 1) * page_size, page_size
+    )
+    response = [
+        {
+            "title": row["title"],
+            "url_file": f"/api/files/{quote(row['filename'])}/download",
+            "language": row["language"],
+            "collection": row["collection"],
+            "sha256": row["sha256"],
+            "size": row["size"],
+            "pages": row["pages"],
+            "chunks": row["chunks"],
+            "status": row["status"],
+            "error": row["error"],
+            "uploaded_at": row["created_at"]
+        }
+        for row in rows
+    ]
 
     return {
         "status": "success",
         "response": [
-            {"total_files": len(response)},
+            {"total_files": total, "page": page, "page_size": page_size},
             {"files": response}
         ]
     }
+
+def hash_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(1024 * 1024):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+@router.api_route("/{filename:path}/download", methods=["GET", "HEAD"])
+async def download_file(filename: str, request: Request):
+    """Serve a catalogued PDF with a content-hash ETag and single-range support for lazy page loading.
+
+    filename is the catalog key, which may include a language folder ("indonesian/x.pdf").
+    """
+    row = await asyncio.to_thread(file_catalog.get, filename)
+    upload_dir = os.path.realpath(UPLOAD_DIR)
+    path = os.path.realpath(os.path.join(upload_dir, row["path"])) if row else None
+    if not path or not path.startswith(upload_dir + os.sep) or not os.path.isfile(path):
+        raise HTTPException(status_code=404, detail=f"File '{filename}' not found")
+
+    sha256 = row["sha256"]
+    if not sha256:
+        # Files imported from an existing upload directory are hashed on first download.
+        sha256 = await asyncio.to_thread(hash_file, path)
+        await asyncio.to_thread(file_catalog.record_hash, filename, sha256)
+    etag = f'"{sha256}"'
+    headers = {"etag": etag, "cache-control": "private, no-cache", "accept-ranges": "bytes"}
+
+    if_none_match = request.headers.get("if-none-match", "")
+    if if_none_match.strip() == "*" or etag in [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+
+    size = os.path.getsize(path)
+    byte_range = None
+    if_range = request.headers.get("if-range")
+    if not if_range or if_range.strip() == etag:
+        try:
+            byte_range = parse_range(request.headers.get("range"), size)
+        except RangeNotSatisfiable:
+            return Response(status_code=416, headers={**headers, "content-range": f"bytes */{size}"})
+    start, end = byte_range or (0, size - 1)
+
+    return RangeFileResponse(
+        path, start, end, size,
+        headers=headers,
+        media_type="application/pdf",
+        filename=os.path.basename(path),
+        content_disposition_type="inline",
+        method=request.method
+    )
@@ -1,7 +1,43 @@
 from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+from core import metrics
+from services.generation_cache import generation_cache, generation_flights
+from services.semantic_cache import semantic_cache
+from services.question_pool import question_pool
+from services import ollama_client
+from services.admission import admission
+from services.token_budget import output_stats
+from services import neo4j_operations
+from services.file_catalog import file_catalog
+from services.startup import readiness
 
 router = APIRouter(prefix="/health", tags=["health"])
 
 @router.get("/")
 async def health_check():
     return {"status": "healthy", "api_version": "1.0.0"}
+
+@router.get("/stats")
+async def generation_stats():
+    return {
+        "status": "success",
+        "metrics": metrics.snapshot(),
+        "cache": generation_cache.stats(),
+        "semantic_cache": semantic_cache.stats(),
+        "in_flight_generations": generation_flights.in_flight(),
+        "question_pool": question_pool.stats(),
+        "ollama_hosts": ollama_client.pool.stats(),
+        "admission": admission.stats(),
+        "output_tokens": output_stats(),
+        "graph_gc": neo4j_operations.last_gc_report,
+        "file_catalog": file_catalog.stats()
+    }
+
+@router.get("/queue")
+async def queue_depth():
+    return admission.stats()
+
+@router.get("/ready")
+async def ready():
+    """200 once startup warm-up (schema, indexes, model preload) has completed, 503 until then."""
+    return JSONResponse(readiness, status_code=200 if readiness["ready"] else 503)
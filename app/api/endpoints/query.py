@@ -1,46 +1,87 @@
-from fastapi import APIRouter, Depends
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import JSONResponse, StreamingResponse
 from models.schemas import QueryRequest, EssayRequest
-from core.dependencies import get_graph, get_vector_retriever, get_vector_retriever_en
+from core.dependencies import get_graph, get_vector_retriever_for
 from services.neo4j_operations import query_rag_system, query_rag_essay, query_rag_mcq
 from services.llm_services import LLMService
-from utils.helpers import is_mcq_request
+from utils.helpers import is_mcq_request, extract_num_questions, sse_event
 from services.essay_services import EssayService
+from services.question_pool import take_from_pool
+from services.file_catalog import file_catalog
+from services.admission import admission, AdmissionRejected
+from utils.cancellation import cancel_on_disconnect, iterate_until
+from core.config import QUESTION_POOL_ENABLED
+from core import metrics
+import asyncio
 import re 
 import traceback
 
 router = APIRouter(prefix="/api", tags=["query"])
 
+async def serve_from_pool(kind, request, language, collection=None):
+    if not QUESTION_POOL_ENABLED or request.fresh:
+        return None
+    response = await take_from_pool(kind, request.question, language, extract_num_questions(request.question), collection)
+    if not response:
+        return None
+    return {
+        "status": "success",
+        "query": request.question,
+        "response": response,
+        "metadata": {"type": kind, **response.pop("metadata")}
+    }
+
+# Candidates fetched per collection query; the retriever cannot filter by metadata, so it over-fetches.
+COLLECTION_CANDIDATES = 20
+COLLECTION_CHUNKS = 4
+
+async def retrieve_collection_docs(vector_retriever, question: str, collection: str):
+    """Top chunks among the files the catalog lists under collection."""
+    _, rows = await asyncio.to_thread(file_catalog.list, None, collection, None, None, 0, 100000)
+    files = {row["filename"] for row in rows}
+    if not files:
+        return []
+    with metrics.timer(stage="retrieval"):
+        docs = await vector_retriever.vectorstore.asimilarity_search(question, k=COLLECTION_CANDIDATES)
+    return [doc for doc in docs if doc.metadata.get("source_file") in files][:COLLECTION_CHUNKS]
+
 @router.post("/query-essay")
-async def query_essay(request: QueryRequest, graph=Depends(get_graph)):
+async def query_essay(request: QueryRequest, http_request: Request):
     try:
         question = request.question
         language = request.language.lower() if request.language else 'indonesian'
-        collection = getattr(request, 'collection_name', None)
+        collection = request.collection_name or None
 
-        vector_retriever = get_vector_retriever_en() if language == 'english' else get_vector_retriever()
+        pooled = await serve_from_pool("essay", request, language, collection)
+        if pooled:
+            return JSONResponse(content=pooled)
+
+        admission.check()
+
+        vector_retriever = await asyncio.to_thread(get_vector_retriever_for, language)
+        graph = await asyncio.to_thread(get_graph, language)
 
         is_essay = any(k in question.lower() for k in ['essay', 'soal', 'pertanyaan'])
 
         if collection:
-            docs = vector_retriever.retrieve_docs(question, collection)
+            docs = await retrieve_collection_docs(vector_retriever, question, collection)
             if not docs:
                 return JSONResponse(status_code=400, content={"status": "error", "message": "No relevant information found."})
 
-            context = vector_retriever.combine_docs(docs)
+            context = "\n\n".join(doc.page_content for doc in docs)
             essay_service = EssayService()
 
             if is_essay:
                 print(f"Processing Essay request: {question}")
-                response = essay_service.generate_essay(question, context)
+                response = await cancel_on_disconnect(
+                    http_request,
+                    essay_service.generate_essay(question, context, json_mode=request.json_mode, fresh=request.fresh, collection=collection, language=language)
+                )
+                generation = response.pop("metadata", {})
 
                 if response.get("total_questions", 0) == 0:
                     return JSONResponse(status_code=400, content={"status": "error", "message": "Failed to generate valid essay questions."})
 
-                filtered = [q for q in response["questions"] if not re.search(r"\bA\)", q, re.IGNORECASE)]
-                response["questions"] = filtered
-                response["total_questions"] = len(filtered)
-
                 expected = int(re.search(r'(\d+)\s*(?:soal|pertanyaan|question)', question, re.I).group(1)) if re.search(r'(\d+)\s*(?:soal|pertanyaan|question)', question, re.I) else 10
                 if response["total_questions"] < expected:
                     response["warning"] = f"Hanya {response['total_questions']} soal yang berhasil dibuat dari {expected} yang diminta."
@@ -53,17 +94,23 @@ async def query_essay(request: QueryRequest, graph=Depends(get_graph)):
                     "metadata": {
                         "model": "EssayService",
                         "document_chunks": len(docs),
-                        "type": "essay"
+                        "type": "essay",
+                        **generation
                     }
                 })
 
-        result = query_rag_essay(question, vector_retriever, graph, language)
+        result = await cancel_on_disconnect(
+            http_request,
+            query_rag_essay(question, vector_retriever, graph, language, json_mode=request.json_mode, fresh=request.fresh)
+        )
 
         if not result or not result.get("response"):
             return JSONResponse(status_code=400, content={"status": "error", "message": "Question is out of context or unanswerable."})
 
         return JSONResponse(content=result)
 
+    except HTTPException:
+        raise
     except Exception as e:
         return JSONResponse(
             status_code=500,
@@ -71,27 +118,38 @@ async def query_essay(request: QueryRequest, graph=Depends(get_graph)):
         )
 
 @router.post("/query-mcq")
-async def query_json(request: QueryRequest, graph=Depends(get_graph)):
+async def query_json(request: QueryRequest, http_request: Request):
     try:
         question = request.question
         language = request.language.lower() if request.language else 'indonesian'
-        collection = getattr(request, 'collection_name', None)
+        collection = request.collection_name or None
+
+        if is_mcq_request(question):
+            pooled = await serve_from_pool("mcq", request, language, collection)
+            if pooled:
+                return JSONResponse(content=pooled)
+
+        admission.check()
 
-        vector_retriever = get_vector_retriever_en() if language == 'english' else get_vector_retriever()
+        vector_retriever = await asyncio.to_thread(get_vector_retriever_for, language)
+        graph = await asyncio.to_thread(get_graph, language)
 
         is_mcq = is_mcq_request(question)
 
         if collection:
-            docs = vector_retriever.retrieve_docs(question, collection)
+            docs = await retrieve_collection_docs(vector_retriever, question, collection)
             if not docs:
                 return JSONResponse(status_code=400, content={"status": "error", "message": "No relevant information found."})
 
-            context = vector_retriever.combine_docs(docs)
+            context = "\n\n".join(doc.page_content for doc in docs)
             llm = LLMService()
 
             if is_mcq:
                 print(f"Processing MCQ request: {question}")
-                response = llm.generate_mcq(question, language, context)
+                response = await cancel_on_disconnect(
+                    http_request,
+                    llm.generate_mcq(question, language, context, json_mode=request.json_mode, fresh=request.fresh, collection=collection)
+                )
 
                 if response["total_questions"] == 0:
                     return JSONResponse(status_code=400, content={"status": "error", "message": "Failed to generate valid MCQs."})
@@ -101,10 +159,11 @@ async def query_json(request: QueryRequest, graph=Depends(get_graph)):
                     response["warning"] = f"Hanya {response['total_questions']} soal yang berhasil dibuat dari {expected} yang diminta."
 
             else:
-                response = llm.generate_json_response(question, language, context)
+                response = await cancel_on_disconnect(http_request, llm.generate_json_response(question, language, context))
                 if not response:
                     return JSONResponse(status_code=400, content={"status": "error", "message": "Question is out of context or unanswerable."})
 
+            generation = response.pop("metadata", {})
             return JSONResponse(content={
                 "status": "success",
                 "query": question,
@@ -113,18 +172,24 @@ async def query_json(request: QueryRequest, graph=Depends(get_graph)):
                 "metadata": {
                     "model": llm.model,
                     "document_chunks": len(docs),
-                    "type": "mcq" if is_mcq else "general"
+                    "type": "mcq" if is_mcq else "general",
+                    **generation
                 }
             })
 
         fallback_func = query_rag_mcq if is_mcq else query_rag_system
-        result = fallback_func(question, vector_retriever, graph, language=language)
+        result = await cancel_on_disconnect(
+            http_request,
+            fallback_func(question, vector_retriever, graph, language=language, json_mode=request.json_mode, fresh=request.fresh)
+        )
 
         if not result or not result.get("response"):
             return JSONResponse(status_code=400, content={"status": "error", "message": "Question is out of context or unanswerable."})
 
         return JSONResponse(content=result)
 
+    except HTTPException:
+        raise
     except Exception as e:
         import traceback
         return JSONResponse(
@@ -136,3 +201,67 @@ async def query_json(request: QueryRequest, graph=Depends(get_graph)):
             }
         )
 
+
+async def stream_questions(question, items, model, document_chunks, question_type):
+    expected = extract_num_questions(question)
+    yield sse_event("meta", {"query": question, "model": model, "document_chunks": document_chunks, "type": question_type, "expected": expected})
+    total = 0
+    try:
+        async for item in iterate_until(items):
+            total += 1
+            yield sse_event("question", item)
+    except asyncio.TimeoutError:
+        yield sse_event("error", {"status": "error", "message": "Generation exceeded the request deadline.", "code": 504})
+        return
+    except AdmissionRejected as e:
+        yield sse_event("error", {"status": "error", "message": e.detail, "code": e.status_code, "retry_after": e.retry_after})
+        return
+    except Exception as e:
+        yield sse_event("error", {"status": "error", "message": str(e)})
+        return
+
+    done = {"status": "success", "total_questions": total}
+    if total < expected:
+        done["warning"] = f"Hanya {total} soal yang berhasil dibuat dari {expected} yang diminta."
+    yield sse_event("done", done)
+
+def event_stream_response(generator):
+    return StreamingResponse(
+        generator,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.post("/query-mcq/stream")
+async def query_mcq_stream(request: QueryRequest):
+    question = request.question
+    language = request.language.lower() if request.language else 'indonesian'
+    admission.check()
+    vector_retriever = await asyncio.to_thread(get_vector_retriever_for, language)
+
+    with metrics.timer(stage="retrieval"):
+        docs = await vector_retriever.ainvoke(question)
+    if not docs:
+        return JSONResponse(status_code=400, content={"status": "error", "message": "No relevant information found."})
+
+    context = "\n\n".join(doc.page_content for doc in docs)
+    llm = LLMService()
+    items = llm.stream_mcq(question, language, context, extract_num_questions(question), json_mode=request.json_mode)
+    return event_stream_response(stream_questions(question, items, llm.model, len(docs), "mcq"))
+
+@router.post("/query-essay/stream")
+async def query_essay_stream(request: QueryRequest):
+    question = request.question
+    language = request.language.lower() if request.language else 'indonesian'
+    admission.check()
+    vector_retriever = await asyncio.to_thread(get_vector_retriever_for, language)
+
+    with metrics.timer(stage="retrieval"):
+        docs = await vector_retriever.ainvoke(question)
+    if not docs:
+        return JSONResponse(status_code=400, content={"status": "error", "message": "No relevant information found."})
+
+    context = "\n\n".join(doc.page_content for doc in docs)
+    essay_service = EssayService()
+    items = essay_service.stream_essay(question, context, extract_num_questions(question), json_mode=request.json_mode)
+    return event_stream_response(stream_questions(question, items, essay_service.model, len(docs), "essay"))
@@ -1,32 +1,77 @@
-from fastapi import APIRouter, UploadFile, File, Depends, HTTPException
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, BackgroundTasks
 from models.schemas import UploadResponse
-from services.pdf_processing import load_pdf, store_documents
-from core.config import UPLOAD_DIR
+from services.pdf_processing import load_pdf, ingest_documents
+from services.question_pool import build_pools
+from services.file_catalog import file_catalog
+from services.semantic_cache import semantic_cache
+from core.config import UPLOAD_DIR, QUESTION_POOL_ENABLED
 from core.dependencies import get_graph
-import shutil
+from utils.helpers import upload_key
+import asyncio
+import hashlib
 import os
 import logging
 
 router = APIRouter(prefix="/api/upload-file", tags=["upload"])
 
+def save_upload(source, file_path: str):
+    """Copy an upload to disk, hashing while copying so the catalog (and download ETags) never need to re-read it."""
+    digest = hashlib.sha256()
+    size = 0
+    with open(file_path, "wb") as buffer:
+        while chunk := source.read(1024 * 1024):
+            digest.update(chunk)
+            buffer.write(chunk)
+            size += len(chunk)
+    return digest.hexdigest(), size
+
 @router.post("/", response_model=UploadResponse)
-async def upload_pdf(file: UploadFile = File(...), graph=Depends(get_graph)):
+async def upload_pdf(
+    background_tasks: BackgroundTasks,
+    file: UploadFile = File(...),
+    language: str = Form("indonesian"),
+    collection: str = Form("")
+):
     try:
+        # Uploads are stored flat; the key names the file in the graph, the catalog and on disk.
+        try:
+            filename = upload_key(os.path.basename(file.filename or ""))
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"Invalid filename: '{file.filename}'")
         os.makedirs(UPLOAD_DIR, exist_ok=True)
-        file_path = os.path.join(UPLOAD_DIR, file.filename)
-        
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        file_path = os.path.join(UPLOAD_DIR, filename)
         
-        documents = load_pdf(file_path)
-        doc_count = store_documents(documents, graph)
+        # The copy and PDF parsing are blocking; keep them off the event loop.
+        sha256, size = await asyncio.to_thread(save_upload, file.file, file_path)
+        await asyncio.to_thread(
+            file_catalog.record_upload, filename, filename, language.lower(), collection, sha256, size
+        )
+
+        try:
+            documents = await asyncio.to_thread(load_pdf, file_path)
+            # Chunks go to the language's database, the one its retriever reads.
+            graph = await asyncio.to_thread(get_graph, language)
+            doc_count = await ingest_documents(documents, graph, language.lower())
+        except Exception as e:
+            await asyncio.to_thread(file_catalog.mark_failed, filename, str(e))
+            raise
+        finally:
+            # Even a partial ingest changes what retrieval returns for this collection.
+            await asyncio.to_thread(semantic_cache.bump_version, collection, language)
+        pages = max((doc.metadata.get("page", 0) for doc in documents), default=-1) + 1
+        await asyncio.to_thread(file_catalog.mark_ingested, filename, pages, doc_count)
+
+        if QUESTION_POOL_ENABLED:
+            background_tasks.add_task(build_pools, filename, language.lower(), documents, collection)
         
         return UploadResponse(
-            filename=file.filename, 
-            language=file.language, 
+            filename=filename, 
+            language=language, 
             document_count=doc_count, 
             message="Upload successful"
         )
+    except HTTPException:
+        raise
     except Exception as e:
         logging.error(f"Error in upload_pdf: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error processing PDF: {str(e)}")
\ No newline at end of file
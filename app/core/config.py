@@ -1,3 +1,4 @@
+import json
 import os
 from dotenv import load_dotenv
 
@@ -5,8 +6,81 @@ load_dotenv()
 
 OLLAMA_HOST = os.getenv("OLLAMA_HOST", "http://192.168.100.3:11434")
 OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "llama3.2:latest")
+OLLAMA_TIMEOUT = float(os.getenv("OLLAMA_TIMEOUT", "600"))
+OLLAMA_MAX_CONNECTIONS = int(os.getenv("OLLAMA_MAX_CONNECTIONS", "32"))
+OLLAMA_MAX_KEEPALIVE = int(os.getenv("OLLAMA_MAX_KEEPALIVE", "16"))
+OLLAMA_KEEPALIVE_EXPIRY = float(os.getenv("OLLAMA_KEEPALIVE_EXPIRY", "120"))
+OLLAMA_NUM_CTX = int(os.getenv("OLLAMA_NUM_CTX", "8192"))
+OLLAMA_MODEL_NUM_CTX = json.loads(os.getenv("OLLAMA_MODEL_NUM_CTX", "{}"))
+CHARS_PER_TOKEN = float(os.getenv("CHARS_PER_TOKEN", "3.5"))
+TOKEN_SAFETY_MARGIN = int(os.getenv("TOKEN_SAFETY_MARGIN", "128"))
+OUTPUT_TOKEN_HEADROOM = float(os.getenv("OUTPUT_TOKEN_HEADROOM", "1.3"))
+OUTPUT_STATS_MIN_SAMPLES = int(os.getenv("OUTPUT_STATS_MIN_SAMPLES", "5"))
+OUTPUT_STATS_WINDOW = int(os.getenv("OUTPUT_STATS_WINDOW", "200"))
+# num_predict for free-form answers, which have no per-question estimate.
+ANSWER_OUTPUT_TOKENS = int(os.getenv("ANSWER_OUTPUT_TOKENS", "1024"))
+OLLAMA_MAX_CONCURRENCY = int(os.getenv("OLLAMA_MAX_CONCURRENCY", "2"))
+# Comma-separated "url|max_concurrency" entries; the limit falls back to OLLAMA_MAX_CONCURRENCY.
+OLLAMA_HOSTS = [
+    (entry.split("|")[0].strip(), int(entry.split("|")[1]) if "|" in entry else OLLAMA_MAX_CONCURRENCY)
+    for entry in os.getenv("OLLAMA_HOSTS", OLLAMA_HOST).split(",")
+    if entry.strip()
+]
+# How long Ollama keeps the chat and embedding models loaded after the startup preload.
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+STARTUP_WARMUP = os.getenv("STARTUP_WARMUP", "true").lower() == "true"
+STARTUP_RETRY_SECONDS = float(os.getenv("STARTUP_RETRY_SECONDS", "10"))
+OLLAMA_HEALTH_INTERVAL = float(os.getenv("OLLAMA_HEALTH_INTERVAL", "15"))
+OLLAMA_EJECT_AFTER_FAILURES = int(os.getenv("OLLAMA_EJECT_AFTER_FAILURES", "3"))
+OLLAMA_EJECT_SECONDS = float(os.getenv("OLLAMA_EJECT_SECONDS", "30"))
+# 0 means the sum of the per-host limits in OLLAMA_HOSTS.
+ADMISSION_MAX_IN_FLIGHT = int(os.getenv("ADMISSION_MAX_IN_FLIGHT", "0")) or sum(limit for _, limit in OLLAMA_HOSTS)
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "32"))
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "30"))
+REQUEST_DEADLINE_SECONDS = float(os.getenv("REQUEST_DEADLINE_SECONDS", str(OLLAMA_TIMEOUT)))
+DISCONNECT_POLL_INTERVAL = float(os.getenv("DISCONNECT_POLL_INTERVAL", "1.0"))
+MCQ_BATCH_SIZE = int(os.getenv("MCQ_BATCH_SIZE", "10"))
+MCQ_MIN_BATCH_SIZE = int(os.getenv("MCQ_MIN_BATCH_SIZE", "5"))
+# Estimated Jaccard similarity of content-word character 3-grams. The lowest threshold with no
+# false merges in benchmarks/tune_dedup.py; lower values merge distinct one-word-swap questions.
+DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", "0.8"))
+# Extra MCQ generation calls when deduplication (or a short sub-batch) leaves fewer questions than requested.
+MCQ_DEDUP_TOPUP_RETRIES = int(os.getenv("MCQ_DEDUP_TOPUP_RETRIES", "1"))
+DEDUP_COSINE_THRESHOLD = float(os.getenv("DEDUP_COSINE_THRESHOLD", "0.92"))
+GENERATION_JSON_MODE = os.getenv("GENERATION_JSON_MODE", "false").lower() == "true"
+ESSAY_TOPUP_MAX_RETRIES = int(os.getenv("ESSAY_TOPUP_MAX_RETRIES", "2"))
+# Output tokens (eval_count) all essay top-up calls of one request may generate together.
+ESSAY_TOPUP_TOKEN_BUDGET = int(os.getenv("ESSAY_TOPUP_TOKEN_BUDGET", "4096"))
 NEO4J_URL = os.getenv("NEO4J_URL", "bolt://localhost:7687")
 NEO4J_USER = os.getenv("NEO4J_USER", "neo4j")
 NEO4J_PASSWORD = os.getenv("NEO4J_PASSWORD", "admin.admin")
+# Rows per inner transaction when deleting a file's chunks from the graph.
+NEO4J_DELETE_BATCH_SIZE = int(os.getenv("NEO4J_DELETE_BATCH_SIZE", "500"))
+# Candidate entities checked per orphan-collection transaction after a delete.
+NEO4J_GC_BATCH_SIZE = int(os.getenv("NEO4J_GC_BATCH_SIZE", "1000"))
 UPLOAD_DIR = "uploads"
-os.makedirs(UPLOAD_DIR, exist_ok=True)
\ No newline at end of file
+os.makedirs(UPLOAD_DIR, exist_ok=True)
+CACHE_ENABLED = os.getenv("CACHE_ENABLED", "true").lower() == "true"
+CACHE_PATH = os.getenv("CACHE_PATH", "cache/generation_cache.sqlite3")
+CACHE_TTL_SECONDS = float(os.getenv("CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "5000"))
+os.makedirs(os.path.dirname(CACHE_PATH) or ".", exist_ok=True)
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "true").lower() == "true"
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92"))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "5000"))
+QUESTION_POOL_ENABLED = os.getenv("QUESTION_POOL_ENABLED", "false").lower() == "true"
+QUESTION_POOL_PATH = os.getenv("QUESTION_POOL_PATH", "cache/question_pool.sqlite3")
+QUESTION_POOL_SIZE = int(os.getenv("QUESTION_POOL_SIZE", "20"))
+QUESTION_POOL_LOW_WATERMARK = int(os.getenv("QUESTION_POOL_LOW_WATERMARK", "5"))
+QUESTION_POOL_SECTION_CHUNKS = int(os.getenv("QUESTION_POOL_SECTION_CHUNKS", "5"))
+QUESTION_POOL_MATCH_THRESHOLD = float(os.getenv("QUESTION_POOL_MATCH_THRESHOLD", "0.75"))
+os.makedirs(os.path.dirname(QUESTION_POOL_PATH) or ".", exist_ok=True)
+FILE_CATALOG_PATH = os.getenv("FILE_CATALOG_PATH", "cache/file_catalog.sqlite3")
+os.makedirs(os.path.dirname(FILE_CATALOG_PATH) or ".", exist_ok=True)
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "mxbai-embed-large")
+# "query" serves generation endpoints only, "ingest" serves upload and delete only, "all" serves both.
+WORKER_ROLE = os.getenv("WORKER_ROLE", "all").lower()
+# How often query workers embed chunks another worker stored but did not embed (0 disables).
+VECTOR_REFRESH_SECONDS = float(os.getenv("VECTOR_REFRESH_SECONDS", "300"))
+# Append every tagged Ollama response to this JSONL file for offline replay (empty disables capture).
+REPLAY_CAPTURE_PATH = os.getenv("REPLAY_CAPTURE_PATH", "")
@@ -1,37 +1,99 @@
-from core.config import NEO4J_URL, NEO4J_USER, NEO4J_PASSWORD, OLLAMA_HOST
-from langchain_ollama import OllamaEmbeddings
-from langchain_neo4j import Neo4jGraph
-from langchain_community.vectorstores import Neo4jVector
+import threading
+from core.config import NEO4J_URL, NEO4J_USER, NEO4J_PASSWORD
 
-def get_graph():
-    return Neo4jGraph(url=NEO4J_URL, username=NEO4J_USER, password=NEO4J_PASSWORD)
+# The LangChain and Neo4j packages are imported on first use so that importing the app
+# (and forking workers) stays cheap; see benchmarks/check_import_time.py.
 
-def get_vector_retriever():
-    embed = OllamaEmbeddings(model="mxbai-embed-large", base_url=OLLAMA_HOST)
+# Each language's chunks live in their own database; anything but English uses the Indonesian one.
+# Ingestion, deletion and the retrievers all go through this mapping.
+RETRIEVER_DATABASES = {"indonesian": "indonesiandata", "english": "englishdata"}
+
+_graphs = {}
+_graph_lock = threading.Lock()
+_retrievers = {}
+_retriever_lock = threading.Lock()
+
+def retriever_language(language) -> str:
+    return "english" if (language or "").lower() == "english" else "indonesian"
+
+def get_graph(language):
+    """One Neo4jGraph (and driver connection pool) per language database and process.
+
+    Blocking on first use (the driver connects and reads the schema); call it off the event loop.
+    """
+    key = retriever_language(language)
+    if key not in _graphs:
+        with _graph_lock:
+            if key not in _graphs:
+                from langchain_neo4j import Neo4jGraph
+                _graphs[key] = Neo4jGraph(
+                    url=NEO4J_URL, username=NEO4J_USER, password=NEO4J_PASSWORD, database=RETRIEVER_DATABASES[key]
+                )
+    return _graphs[key]
+
+def close_graph():
+    for key in list(_graphs):
+        _graphs.pop(key)._driver.close()
+
+def build_vector_retriever(language):
+    """Blocking: from_existing_graph embeds every chunk that has no vector yet before returning."""
+    from langchain_community.vectorstores import Neo4jVector
+    from core.embeddings import PooledOllamaEmbeddings
+    embed = PooledOllamaEmbeddings()
     vector_index = Neo4jVector.from_existing_graph(
         embedding=embed,
         search_type="hybrid",
         url=NEO4J_URL,
         username=NEO4J_USER,
         password=NEO4J_PASSWORD,
-        database="indonesiandata",
+        database=RETRIEVER_DATABASES[retriever_language(language)],
         node_label="Document",
         text_node_properties=["text"],
         embedding_node_property="embedding"
     )
     return vector_index.as_retriever()
 
-def get_vector_retriever_en():
-    embed = OllamaEmbeddings(model="mxbai-embed-large", base_url=OLLAMA_HOST)
-    vector_index = Neo4jVector.from_existing_graph(
-        embedding=embed,
-        search_type="hybrid",
-        url=NEO4J_URL,
-        username=NEO4J_USER,
-        password=NEO4J_PASSWORD,
-        database="englishdata",
-        node_label="Document",
-        text_node_properties=["text"],
-        embedding_node_property="embedding"
-    )
-    return vector_index.as_retriever()
\ No newline at end of file
+def get_vector_retriever_for(language):
+    """Cached retriever for a language, built on first use; call it off the event loop."""
+    key = retriever_language(language)
+    if key not in _retrievers:
+        with _retriever_lock:
+            if key not in _retrievers:
+                _retrievers[key] = build_vector_retriever(key)
+    return _retrievers[key]
+
+# The same text from_existing_graph embeds for text_node_properties=["text"].
+MISSING_EMBEDDINGS = """
+MATCH (n:Document) WHERE n.embedding IS NULL AND n.text IS NOT NULL
+RETURN elementId(n) AS id, reduce(str = '', k IN ['text'] | str + '\\n' + k + ':' + coalesce(n[k], '')) AS text
+LIMIT $limit
+"""
+
+SET_EMBEDDINGS = """
+UNWIND $rows AS row
+MATCH (n:Document) WHERE elementId(n) = row.id
+CALL db.create.setNodeVectorProperty(n, 'embedding', row.embedding)
+RETURN count(*) AS embedded
+"""
+
+def refresh_vector_retriever(language, batch_size: int = 1000) -> int:
+    """Blocking: embed chunks ingested since the language's retriever was built; returns how many.
+
+    Builds the retriever (which embeds everything missing) if this process has none yet,
+    otherwise reuses its store and driver.
+    """
+    key = retriever_language(language)
+    if key not in _retrievers:
+        get_vector_retriever_for(key)
+        return 0
+    store = _retrievers[key].vectorstore
+    embedded = 0
+    while rows := store.query(MISSING_EMBEDDINGS, params={"limit": batch_size}):
+        vectors = store.embedding.embed_documents([row["text"] for row in rows])
+        result = store.query(SET_EMBEDDINGS, params={
+            "rows": [{"id": row["id"], "embedding": vector} for row, vector in zip(rows, vectors)]
+        })
+        if not result or not result[0]["embedded"]:
+            break
+        embedded += result[0]["embedded"]
+    return embedded
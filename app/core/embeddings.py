@@ -0,0 +1,21 @@
+from langchain_core.embeddings import Embeddings
+from core.config import EMBEDDING_MODEL
+from services import ollama_client
+
+class PooledOllamaEmbeddings(Embeddings):
+    """LangChain embeddings that go through the Ollama host pool instead of a single base_url."""
+
+    def __init__(self, model: str = EMBEDDING_MODEL):
+        self.model = model
+
+    def embed_documents(self, texts):
+        return [ollama_client.embeddings_sync(text, model=self.model) for text in texts]
+
+    def embed_query(self, text):
+        return ollama_client.embeddings_sync(text, model=self.model)
+
+    async def aembed_documents(self, texts):
+        return [await ollama_client.embeddings(text, model=self.model) for text in texts]
+
+    async def aembed_query(self, text):
+        return await ollama_client.embeddings(text, model=self.model)
@@ -0,0 +1,163 @@
+import bisect
+import math
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+_counters = defaultdict(float)
+_histograms = {}
+_lock = threading.Lock()
+
+# Seconds; covers sub-millisecond parsing up to multi-minute generations.
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+HELP = {
+    "stage_duration_seconds": "Time spent per pipeline stage (retrieval, embedding, prompt_build, ollama_prefill, ollama_decode, parse).",
+    "http_request_duration_seconds": "End-to-end request latency by route.",
+    "ollama_time_to_first_token_seconds": "Time from sending a chat request to its first streamed token.",
+    "ollama_prompt_tokens_total": "Prompt tokens evaluated by Ollama (prompt_eval_count).",
+    "ollama_eval_tokens_total": "Tokens generated by Ollama (eval_count) in generations that ran to completion.",
+    "ollama_stopped_chunks_total": "Chunks streamed before a generation was stopped early or cancelled; Ollama reports no eval_count for those.",
+    "generation_retries_total": "Extra generation calls made because a response came up short.",
+    "generation_path_total": "Parse path taken per generation, including fallbacks.",
+    "cache_requests_total": "Generation cache lookups by result.",
+}
+
+# Every series of these metrics carries exactly these labels; ones a stage has no value for are "".
+LABELS = {
+    "stage_duration_seconds": ("stage", "kind", "format", "model"),
+}
+
+def _key(name: str, labels):
+    names = LABELS.get(name)
+    if names is not None:
+        unknown = set(labels) - set(names)
+        if unknown:
+            raise ValueError(f"{name} has no label(s) {', '.join(sorted(unknown))}; expected {', '.join(names)}")
+        labels = {label: labels.get(label, "") for label in names}
+    return name, tuple(sorted(labels.items()))
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.counts):
+            self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+
+def increment(name: str, value: float = 1, **labels):
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] += value
+
+def observe(name: str, value: float, buckets=LATENCY_BUCKETS, **labels):
+    key = _key(name, labels)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = Histogram(buckets)
+        histogram.observe(value)
+
+@contextmanager
+def timer(name: str = "stage_duration_seconds", **labels):
+    """Observe the wall time of the with-block, also when it raises."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - started, **labels)
+
+def snapshot():
+    with _lock:
+        items = list(_counters.items())
+        histograms = [(key, h.count, h.sum) for key, h in _histograms.items()]
+    result = defaultdict(list)
+    for (name, labels), value in sorted(items):
+        result[name].append({"labels": dict(labels), "value": value})
+    for (name, labels), count, total in sorted(histograms):
+        result[name].append({"labels": dict(labels), "count": count, "sum": round(total, 6)})
+    return dict(result)
+
+def _format_labels(labels, extra=()):
+    pairs = [*labels, *extra]
+    if not pairs:
+        return ""
+    escaped = (f'{k}="{_escape(v)}"' for k, v in pairs)
+    return "{" + ",".join(escaped) + "}"
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+def render_prometheus() -> str:
+    """All counters and histograms in the Prometheus text exposition format (version 0.0.4)."""
+    with _lock:
+        counters = sorted(_counters.items())
+        histograms = sorted((key, list(h.counts), h.sum, h.count, h.buckets) for key, h in _histograms.items())
+
+    lines, declared = [], set()
+
+    def declare(name, kind):
+        if name not in declared:
+            declared.add(name)
+            if name in HELP:
+                lines.append(f"# HELP {name} {HELP[name]}")
+            lines.append(f"# TYPE {name} {kind}")
+
+    for (name, labels), value in counters:
+        declare(name, "counter")
+        lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+    for (name, labels), counts, total, count, buckets in histograms:
+        declare(name, "histogram")
+        cumulative = 0
+        for bound, bucket_count in zip(buckets, counts):
+            cumulative += bucket_count
+            lines.append(f"{name}_bucket{_format_labels(labels, [('le', _format_value(bound))])} {cumulative}")
+        lines.append(f"{name}_bucket{_format_labels(labels, [('le', '+Inf')])} {count}")
+        lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(total)}")
+        lines.append(f"{name}_count{_format_labels(labels)} {count}")
+    return "\n".join(lines) + "\n"
+
+class MetricsMiddleware:
+    """ASGI middleware timing every HTTP request until its last body chunk, labelled by route template."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get("route")
+            observe(
+                "http_request_duration_seconds",
+                time.perf_counter() - started,
+                method=scope["method"],
+                route=getattr(route, "path", "unmatched"),
+                status=status,
+            )
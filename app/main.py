@@ -1,8 +1,41 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from api.endpoints import query, upload, delete, files, health
+from importlib import import_module
+from services.ollama_client import close_client, pool
+from services.file_catalog import file_catalog
+from services import startup
+from core.config import UPLOAD_DIR, STARTUP_WARMUP, WORKER_ROLE, VECTOR_REFRESH_SECONDS
+from core.dependencies import close_graph
+from core.metrics import MetricsMiddleware
+import asyncio
 
-app = FastAPI(title="AI Generative Question V2")
+# Routers per WORKER_ROLE; a query-only worker never imports the PDF and graph-extraction stack.
+ROLE_ROUTERS = {
+    "query": ("query", "files", "health", "dedup", "metrics"),
+    "ingest": ("upload", "delete", "files", "health", "metrics"),
+    "all": ("query", "upload", "delete", "files", "health", "dedup", "metrics"),
+}
+
+if WORKER_ROLE not in ROLE_ROUTERS:
+    raise RuntimeError(f"Unknown WORKER_ROLE '{WORKER_ROLE}'; expected one of: {', '.join(ROLE_ROUTERS)}")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    pool.start_probing()
+    await asyncio.to_thread(file_catalog.import_directory, UPLOAD_DIR)
+    # Serve liveness right away; /health/ready answers 503 until the warm-up has finished.
+    warm_up = asyncio.create_task(startup.warm_up()) if STARTUP_WARMUP else None
+    # Ingest workers embed what they store; query workers pick up anything an ingest worker left unembedded.
+    refresh = asyncio.create_task(startup.refresh_retrievers()) if VECTOR_REFRESH_SECONDS > 0 and WORKER_ROLE != "ingest" else None
+    yield
+    for task in (warm_up, refresh):
+        if task is not None:
+            task.cancel()
+    await close_client()
+    close_graph()
+
+app = FastAPI(title="AI Generative Question V2", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -11,16 +44,14 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(MetricsMiddleware)
 
-app.include_router(query.router)
-app.include_router(upload.router)
-app.include_router(delete.router)
-app.include_router(files.router)
-app.include_router(health.router)
+for name in ROLE_ROUTERS[WORKER_ROLE]:
+    app.include_router(import_module(f"api.endpoints.{name}").router)
 
 @app.get("/")
 async def root():
-    return {"message": "Welcome to Neo4j PDF RAG API"}
+    return {"message": "Welcome to Neo4j PDF RAG API", "role": WORKER_ROLE}
 
 if __name__ == "__main__":
     import uvicorn
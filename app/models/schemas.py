@@ -1,9 +1,12 @@
 from pydantic import BaseModel, Field
-from typing import List, Optional
+from typing import List, Literal, Optional
 
 class QueryRequest(BaseModel):
     question: str = Field(..., description="The question to ask the RAG system")
     language: str = Field(..., description="The question to select a language(indonesian/english)")
+    json_mode: Optional[bool] = Field(default=None, description="Generate questions as schema-validated JSON instead of free text")
+    fresh: bool = Field(default=False, description="Skip the generation cache and always produce new questions")
+    collection_name: Optional[str] = Field(default=None, description="Only use files uploaded with this collection (retrieval and question pool)")
 
 class EssayRequest(BaseModel):
     question: str = Field(..., description="The question or prompt for essay generation")
@@ -27,4 +30,25 @@ class DeleteByNameRequest(BaseModel):
 
 class DeleteResponse(BaseModel):
     message: str
-    deleted_nodes: int
\ No newline at end of file
+    deleted_nodes: int
+    deleted_relationships: int = 0
+
+class MCQOptions(BaseModel):
+    A: str = Field(..., min_length=1)
+    B: str = Field(..., min_length=1)
+    C: str = Field(..., min_length=1)
+    D: str = Field(..., min_length=1)
+
+class MCQItem(BaseModel):
+    question: str = Field(..., min_length=1)
+    options: MCQOptions
+    answer: Literal["A", "B", "C", "D"]
+
+class EssayItem(BaseModel):
+    question: str = Field(..., min_length=1)
+    answer: str = Field(..., min_length=1)
+
+class DedupRequest(BaseModel):
+    questions: List[str] = Field(..., description="Question texts to check for near-duplicates")
+    threshold: Optional[float] = Field(default=None, description="Minimum estimated Jaccard similarity of content-word character 3-grams")
+    use_embeddings: bool = Field(default=False, description="Also merge questions whose embedding cosine similarity is above the cosine threshold")
@@ -0,0 +1,117 @@
+import asyncio
+import heapq
+import itertools
+import math
+import time
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from fastapi import HTTPException
+from core import metrics
+from core.config import ADMISSION_MAX_IN_FLIGHT, ADMISSION_MAX_QUEUE, ADMISSION_QUEUE_TIMEOUT
+
+INTERACTIVE = 0
+INGESTION = 1
+PRIORITY_NAMES = {INTERACTIVE: "interactive", INGESTION: "ingestion"}
+
+# Priority of generations started from the current task; ingestion code sets INGESTION.
+priority = ContextVar("generation_priority", default=INTERACTIVE)
+
+class AdmissionRejected(HTTPException):
+    def __init__(self, status_code: int, detail: str, retry_after: int):
+        super().__init__(status_code=status_code, detail=detail, headers={"Retry-After": str(retry_after)})
+        self.retry_after = retry_after
+
+class AdmissionController:
+    """Bounded priority queue in front of LLM generations.
+
+    At most max_in_flight generations run at once. Waiting interactive requests are
+    always admitted before ingestion work; once max_queue interactive requests are
+    waiting new ones get 429, and those that wait longer than queue_timeout get 503.
+    Ingestion work is never rejected, it just waits.
+    """
+
+    def __init__(self, max_in_flight: int, max_queue: int, queue_timeout: float):
+        self.max_in_flight = max(1, max_in_flight)
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self._queue = []
+        self._seq = itertools.count()
+        self._avg_hold = 10.0
+
+    def queued(self, level: int = None) -> int:
+        return sum(1 for entry in self._queue if level is None or entry[0] == level)
+
+    def retry_after(self) -> int:
+        """Seconds until a new request would plausibly get a slot, from the average slot hold time."""
+        return max(1, math.ceil(self._avg_hold * (self.queued() + 1) / self.max_in_flight))
+
+    def reject(self, status_code: int, reason: str):
+        metrics.increment("admission_rejected_total", status=status_code, reason=reason)
+        return AdmissionRejected(status_code, f"Generation backend is saturated ({reason}), retry later.", self.retry_after())
+
+    def check(self):
+        """Fail fast before doing retrieval when an interactive request could not be queued."""
+        if self.in_flight >= self.max_in_flight and self.queued(INTERACTIVE) >= self.max_queue:
+            raise self.reject(429, "queue_full")
+
+    async def acquire(self, level: int = None):
+        level = priority.get() if level is None else level
+        if self.in_flight < self.max_in_flight and not any(entry[0] <= level for entry in self._queue):
+            self.in_flight += 1
+            metrics.increment("admission_admitted_total", priority=PRIORITY_NAMES[level], queued="false")
+            return
+        if level == INTERACTIVE and self.queued(INTERACTIVE) >= self.max_queue:
+            raise self.reject(429, "queue_full")
+
+        future = asyncio.get_running_loop().create_future()
+        entry = (level, next(self._seq), future)
+        heapq.heappush(self._queue, entry)
+        try:
+            await asyncio.wait_for(future, self.queue_timeout if level == INTERACTIVE else None)
+        except asyncio.TimeoutError:
+            self._remove(entry)
+            raise self.reject(503, "queue_timeout")
+        except asyncio.CancelledError:
+            self._remove(entry)
+            if future.done() and not future.cancelled():
+                # The slot was handed to us just before we went away.
+                self.release()
+            raise
+        metrics.increment("admission_admitted_total", priority=PRIORITY_NAMES[level], queued="true")
+
+    def release(self, held_for: float = None):
+        if held_for is not None:
+            self._avg_hold = 0.8 * self._avg_hold + 0.2 * held_for
+        while self._queue:
+            _, _, future = heapq.heappop(self._queue)
+            if not future.done():
+                # Hand the slot straight to the next waiter; in_flight stays the same.
+                future.set_result(None)
+                return
+        self.in_flight -= 1
+
+    def _remove(self, entry):
+        if entry in self._queue:
+            self._queue.remove(entry)
+            heapq.heapify(self._queue)
+
+    @asynccontextmanager
+    async def slot(self, level: int = None):
+        await self.acquire(level)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(time.monotonic() - started)
+
+    def stats(self):
+        return {
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "queued": {name: self.queued(level) for level, name in PRIORITY_NAMES.items()},
+            "max_queue": self.max_queue,
+            "retry_after": self.retry_after()
+        }
+
+admission = AdmissionController(ADMISSION_MAX_IN_FLIGHT, ADMISSION_MAX_QUEUE, ADMISSION_QUEUE_TIMEOUT)
@@ -1,15 +1,22 @@
 import json
+import logging
 import re
-import ollama
 from fastapi import HTTPException, APIRouter, Depends
 from fastapi.responses import JSONResponse
-from core.config import OLLAMA_HOST, OLLAMA_MODEL
+from core.config import OLLAMA_MODEL, ESSAY_TOPUP_MAX_RETRIES, ESSAY_TOPUP_TOKEN_BUDGET, GENERATION_JSON_MODE
+from core import metrics
+from models.schemas import EssayItem
+from services import ollama_client, replay
+from services.generation_cache import cached_generate, context_hash
+from services.token_budget import fit_prompt, record_usage
+from utils.stream_parser import IncrementalQuestionParser, ParsedStream
+from utils.json_stream import IncrementalJSONItemParser
+from utils.helpers import extract_num_questions, normalize_question_text
 
 router = APIRouter()
 
 class EssayService:
     def __init__(self):
-        ollama.base_url = OLLAMA_HOST
         self.model = OLLAMA_MODEL
     
     @staticmethod
@@ -55,97 +62,253 @@ class EssayService:
             **Permintaan pengguna:** {question}
         """
 
-    def generate_essay(self, question: str, context: str):
-        num_questions = 10  
-        num_match = re.search(r'(\d+)\s*(?:soal|pertanyaan|question)', question, re.IGNORECASE)
-        if num_match:
-            num_questions = int(num_match.group(1))
-            print(f"Detected request for {num_questions} questions")
-        
-        try:
-            # First attempt
-            response = ollama.chat(
+    @staticmethod
+    def format_essay_json_prompt(question: str, context: str, num_questions=10) -> str:
+        shape = '{"questions": [{"question": "...", "answer": "..."}]}'
+        return f"""Anda adalah seorang dosen berpengalaman. Buatlah tepat {num_questions} soal ESSAY beserta jawaban lengkapnya berdasarkan konteks di bawah.
+
+            Jawab HANYA dengan JSON berbentuk: {shape}
+            - DILARANG membuat soal pilihan ganda atau opsi A), B), C), D).
+            - Setiap "question" harus berupa pertanyaan terbuka yang membutuhkan penjelasan panjang.
+            - Setiap "answer" harus lengkap dan komprehensif.
+
+            **Konteks:** {context}
+            **Permintaan pengguna:** {question}
+        """
+
+    async def generate_essay_json(self, question: str, context: str, num_questions: int):
+        prompt, options, budget = fit_prompt(
+            self.model, lambda c: self.format_essay_json_prompt(question, c, num_questions), question, context, "essay", num_questions
+        )
+        parsed = ParsedStream(IncrementalJSONItemParser(EssayItem, "essay"), num_questions, accept=lambda q: not self.is_multiple_choice(q))
+        with replay.tag(kind="essay", language="indonesian", num_questions=num_questions):
+            stream = await ollama_client.chat(
+                [{'role': 'user', 'content': prompt}],
                 model=self.model,
-                messages=[{
-                    'role': 'user', 
-                    'content': self.format_essay_prompt(question, context, num_questions)
-                }]
+                stream=True,
+                format='json',
+                options=options
             )
-            
-            content = response['message']['content']
-            print(f"LLM Response (first 300 chars):\n{content[:300]}")  # Debugging
+        questions = await parsed.collect(stream)
+        record_usage("essay", budget, parsed.usage(), len(questions))
+        return questions
 
-            if re.search(r'[A-D]\)', content) or re.search(r'[A-D]\s*\)', content):
-                print("Warning: Detected multiple-choice format in response. Retrying with stronger constraints...")
-                emphasized_prompt = f"""PERHATIAN: Respons sebelumnya masih berisi pilihan ganda dengan opsi A), B), C), D).
-                
-                SAYA SANGAT MENEKANKAN: JANGAN MEMBUAT SOAL PILIHAN GANDA. SAYA HANYA MEMBUTUHKAN SOAL ESSAY.
+    @staticmethod
+    def format_topup_prompt(question: str, context: str, missing: int, existing_questions, start_number: int) -> str:
+        existing = "\n".join(f"- {q}" for q in existing_questions)
+        return f"""Buatlah **{missing} soal ESSAY BARU** berdasarkan konteks dan permintaan di bawah.
 
-                Buatlah {num_questions} soal essay tentang {context} tanpa opsi pilihan ganda.
-                Setiap soal harus berupa pertanyaan terbuka yang membutuhkan jawaban penjelasan panjang.
-                Format yang benar adalah:
+            **DILARANG membuat soal pilihan ganda atau opsi A), B), C), D).**
+            **JANGAN mengulang atau memparafrasekan soal yang sudah ada berikut ini:**
+            {existing}
 
-                Soal 1: [Pertanyaan essay]
-                Jawaban: [Jawaban lengkap]
+            **FORMAT OUTPUT (mulai dari Soal {start_number}):**
+            Soal {start_number}:
+            [Pertanyaan essay]
+            Jawaban: [Jawaban lengkap]
 
-                Soal 2: [Pertanyaan essay]
-                Jawaban: [Jawaban lengkap]
+            **Konteks:** {context}
+            **Permintaan pengguna:** {question}
+        """
 
-                Jangan gunakan format A), B), C), D) atau sejenisnya.
-                Pastikan soal merupakan pertanyaan essay yang kompleks sesuai dengan konteks: {context}
-                """
-                
-                response = ollama.chat(
-                    model=self.model,
-                    messages=[
-                        {'role': 'user', 'content': self.format_essay_prompt(question, context, num_questions)},
-                        {'role': 'assistant', 'content': content},
-                        {'role': 'user', 'content': emphasized_prompt}
-                    ]
-                )
-                content = response['message']['content']
-                print(f"Second attempt response (first 300 chars):\n{content[:300]}")
+    @staticmethod
+    def is_multiple_choice(item) -> bool:
+        return bool(re.search(r'(?:^|\s)[A-D]\s*\)', item["question"]) or re.search(r'(?:^|\s)[A-D]\s*\)', item["answer"]))
 
-            parsed_json = self.parse_essay_text(content, num_questions)
+    @staticmethod
+    def usage_tokens(response) -> int:
+        return response.get('prompt_eval_count', 0) + response.get('eval_count', 0)
 
-            if parsed_json["total_questions"] < num_questions:
-                print("Warning: Incomplete questions extracted. Retrying with a modified prompt...")
-                new_prompt = f"""Saya perlu tepat {num_questions} soal essay tentang {context}.
-                
-                Jawaban Anda sebelumnya hanya menghasilkan {parsed_json["total_questions"]} soal yang dapat diidentifikasi.
-                
-                Mohon berikan {num_questions} soal essay dengan format yang jelas:
-                
-                Soal 1: [Pertanyaan essay]
-                Jawaban: [Jawaban lengkap]
-                
-                Soal 2: [Pertanyaan essay]
-                Jawaban: [Jawaban lengkap]
-                
-                Dan seterusnya hingga Soal {num_questions}.
-                """
+    async def generate_essay(self, question: str, context: str, json_mode=None, fresh: bool = False, collection=None, language=None):
+        json_mode = GENERATION_JSON_MODE if json_mode is None else json_mode
+        # Essays are always written in Indonesian; language names the documents retrieved from.
+        language = language.lower() if language else "indonesian"
+        key_parts = {
+            "question": " ".join(question.lower().split()),
+            "language": language,
+            "context": context_hash(context),
+            "model": self.model,
+            "options": {
+                "json_mode": json_mode,
+                "topup_max_retries": ESSAY_TOPUP_MAX_RETRIES,
+                "topup_token_budget": ESSAY_TOPUP_TOKEN_BUDGET
+            }
+        }
+        semantic = {
+            "text": question,
+            # No context hash: a reworded question retrieves other chunks and could never hit.
+            # The content version added by cached_generate covers uploads and deletes instead.
+            "partition": {
+                "collection": collection or "default",
+                "language": language,
+                "num_questions": extract_num_questions(question),
+                "model": self.model,
+                "json_mode": json_mode
+            }
+        }
+        return await cached_generate(
+            "essay", key_parts, lambda: self.generate_essay_uncached(question, context, json_mode), fresh, semantic
+        )
+
+    async def generate_essay_uncached(self, question: str, context: str, json_mode: bool):
+        num_questions = extract_num_questions(question)
+        logging.debug(f"Detected request for {num_questions} questions")
+        generation_id = replay.new_generation_id()
+        
+        try:
+            questions = None
+            if json_mode:
+                try:
+                    with replay.tag(generation_id=generation_id):
+                        generated = await self.generate_essay_json(question, context, num_questions)
+                    questions = [q for q in generated if not self.is_multiple_choice(q)]
+                except HTTPException:
+                    raise
+                except Exception as e:
+                    logging.warning(f"JSON generation failed, falling back to text: {str(e)}")
+                if questions:
+                    metrics.increment("generation_path_total", kind="essay", path="json" if len(questions) >= num_questions else "json_partial")
+                else:
+                    questions = None
+                    metrics.increment("generation_path_total", kind="essay", path="regex_fallback")
+            else:
+                metrics.increment("generation_path_total", kind="essay", path="regex")
+
+            if questions is None:
+                prompt, options, budget = fit_prompt(
+                    self.model, lambda c: self.format_essay_prompt(question, c, num_questions), question, context, "essay", num_questions
+                )
+                # Multiple-choice items are dropped below, so they must not end the stream.
+                parsed = ParsedStream(IncrementalQuestionParser("essay"), num_questions, accept=lambda q: not self.is_multiple_choice(q))
+                with replay.tag(kind="essay", language="indonesian", num_questions=num_questions, generation_id=generation_id):
+                    stream = await ollama_client.chat(
+                        [{
+                            'role': 'user', 
+                            'content': prompt
+                        }],
+                        model=self.model,
+                        stream=True,
+                        options=options
+                    )
+                await parsed.collect(stream)
                 
-                response = ollama.chat(
-                    model=self.model,
-                    messages=[
-                        {'role': 'user', 'content': self.format_essay_prompt(question, context, num_questions)},
-                        {'role': 'assistant', 'content': content},
-                        {'role': 'user', 'content': new_prompt}
-                    ]
+                content = parsed.content
+                logging.debug(f"LLM response: {len(content)} chars")
+
+                # Keep every usable question and only ask the model for the shortfall,
+                # instead of resending the full prompt plus the previous answer.
+                with metrics.timer(stage="parse", kind="essay", format="text_full"):
+                    questions = [q for q in self.parse_essay_text(content, num_questions)["questions"] if not self.is_multiple_choice(q)]
+                record_usage("essay", budget, parsed.usage(), len(questions))
+
+            seen = {normalize_question_text(q["question"]) for q in questions}
+            # The budget caps generated (output) tokens across top-ups, like num_predict does;
+            # retry_tokens also counts prompt tokens and is reported for cost only.
+            retries, retry_tokens, retry_output_tokens = 0, 0, 0
+
+            while len(questions) < num_questions and retries < ESSAY_TOPUP_MAX_RETRIES and retry_output_tokens < ESSAY_TOPUP_TOKEN_BUDGET:
+                missing = num_questions - len(questions)
+                logging.warning(f"{len(questions)} of {num_questions} valid questions. Requesting {missing} more...")
+                existing = [q["question"] for q in questions]
+                prompt, options, budget = fit_prompt(
+                    self.model,
+                    lambda c: self.format_topup_prompt(question, c, missing, existing, len(questions) + 1),
+                    question, context, "essay", missing
                 )
-                content = response['message']['content']
-                parsed_json = self.parse_essay_text(content, num_questions)
+                options["num_predict"] = min(options["num_predict"], ESSAY_TOPUP_TOKEN_BUDGET - retry_output_tokens)
+                parsed = ParsedStream(IncrementalQuestionParser("essay"), missing, accept=lambda q: not self.is_multiple_choice(q))
+                with replay.tag(kind="essay", language="indonesian", num_questions=missing, attempt="topup", generation_id=generation_id):
+                    stream = await ollama_client.chat(
+                        [{'role': 'user', 'content': prompt}],
+                        model=self.model,
+                        stream=True,
+                        options=options
+                    )
+                await parsed.collect(stream)
+                retries += 1
+                retry_tokens += self.usage_tokens(parsed.usage())
+                retry_output_tokens += parsed.usage()["eval_count"]
+                metrics.increment("generation_retries_total", kind="essay", reason="topup")
+
+                with metrics.timer(stage="parse", kind="essay", format="text_full"):
+                    topup = self.parse_essay_text(parsed.content, missing)["questions"]
+                record_usage("essay", budget, parsed.usage(), len(topup))
+                for q in topup:
+                    key = normalize_question_text(q["question"])
+                    if key in seen or self.is_multiple_choice(q) or len(questions) >= num_questions:
+                        continue
+                    seen.add(key)
+                    questions.append(q)
+
+            for i, q in enumerate(questions, 1):
+                q["number"] = i
+            parsed_json = {
+                "total_questions": len(questions),
+                "questions": questions,
+                "metadata": {
+                    "retries": retries,
+                    "retry_tokens": retry_tokens,
+                    "retry_output_tokens": retry_output_tokens,
+                    "retry_token_budget": ESSAY_TOPUP_TOKEN_BUDGET
+                }
+            }
 
             # Post-process to remove any remaining multiple-choice formatting
             self.clean_multiple_choice_format(parsed_json)
             
             return parsed_json
             
+        except HTTPException:
+            raise
         except Exception as e:
-            import traceback
-            print(f"Error in generate_essay: {str(e)}\n{traceback.format_exc()}")
+            logging.exception(f"Error in generate_essay: {str(e)}")
             raise HTTPException(status_code=500, detail=f"Error processing LLM response: {str(e)}")
     
+    async def stream_essay(self, question: str, context: str, num_questions: int = 10, json_mode=None):
+        json_mode = GENERATION_JSON_MODE if json_mode is None else json_mode
+
+        if json_mode:
+            prompt, options, budget = fit_prompt(
+                self.model, lambda c: self.format_essay_json_prompt(question, c, num_questions), question, context, "essay", num_questions
+            )
+            parser = IncrementalJSONItemParser(EssayItem, "essay")
+            # Same rejection as generate_essay, so streamed and non-streamed requests return the same set.
+            parsed = ParsedStream(parser, num_questions, accept=lambda q: not self.is_multiple_choice(q))
+            try:
+                with replay.tag(kind="essay", language="indonesian", num_questions=num_questions):
+                    stream = await ollama_client.chat(
+                        [{'role': 'user', 'content': prompt}],
+                        model=self.model,
+                        stream=True,
+                        format='json',
+                        options=options
+                    )
+                async for item in parsed.items(stream):
+                    self.clean_multiple_choice_format({"questions": [item]})
+                    yield item
+                record_usage("essay", budget, parsed.usage(), parser.count)
+            except HTTPException:
+                raise
+            except Exception as e:
+                logging.warning(f"JSON streaming failed: {str(e)}")
+            if parsed.accepted:
+                metrics.increment("generation_path_total", kind="essay", path="json" if parsed.accepted >= num_questions else "json_partial")
+                return
+            metrics.increment("generation_path_total", kind="essay", path="regex_fallback")
+        else:
+            metrics.increment("generation_path_total", kind="essay", path="regex")
+
+        prompt, options, budget = fit_prompt(
+            self.model, lambda c: self.format_essay_prompt(question, c, num_questions), question, context, "essay", num_questions
+        )
+        parsed = ParsedStream(IncrementalQuestionParser("essay"), num_questions, accept=lambda q: not self.is_multiple_choice(q))
+        with replay.tag(kind="essay", language="indonesian", num_questions=num_questions):
+            stream = await ollama_client.chat([{'role': 'user', 'content': prompt}], model=self.model, stream=True, options=options)
+        async for item in parsed.items(stream):
+            self.clean_multiple_choice_format({"questions": [item]})
+            yield item
+        record_usage("essay", budget, parsed.usage(), parsed.parser.count)
+
     @staticmethod
     def clean_multiple_choice_format(parsed_json):
         """Remove any remaining multiple-choice formatting from questions and answers"""
@@ -193,13 +356,12 @@ class EssayService:
                 })
         
         if len(questions) < expected_count:
-            print(f"Warning: Only {len(questions)} out of {expected_count} questions extracted!")
-            print("Raw content sample:\n", content[:1000])  # Show first 1000 chars
+            logging.warning(f"Only {len(questions)} out of {expected_count} questions extracted")
 
         return {
             "total_questions": len(questions),
             "questions": questions
         }
         
-    def generate_json_response(self, question: str, context: str):
-        return self.generate_essay(question, context)
\ No newline at end of file
+    async def generate_json_response(self, question: str, context: str, fresh: bool = False):
+        return await self.generate_essay(question, context, fresh=fresh)
\ No newline at end of file
@@ -0,0 +1,151 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+from core.config import FILE_CATALOG_PATH
+
+class FileCatalog:
+    """One row per uploaded PDF: content hash, language, collection, size, page and chunk counts, ingest status.
+
+    Written on upload and delete so listing files never has to walk UPLOAD_DIR. Rows are keyed
+    by utils.helpers.upload_key, the same key as Document.source_file in the graph.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _connection(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.row_factory = sqlite3.Row
+            self._conn.executescript("""
+                CREATE TABLE IF NOT EXISTS files (
+                    filename TEXT PRIMARY KEY,
+                    title TEXT NOT NULL,
+                    path TEXT NOT NULL,
+                    language TEXT NOT NULL,
+                    collection TEXT NOT NULL DEFAULT '',
+                    sha256 TEXT,
+                    size INTEGER NOT NULL DEFAULT 0,
+                    pages INTEGER NOT NULL DEFAULT 0,
+                    chunks INTEGER NOT NULL DEFAULT 0,
+                    status TEXT NOT NULL,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_files_language ON files (language, created_at);
+                CREATE INDEX IF NOT EXISTS idx_files_collection ON files (collection, created_at);
+                CREATE INDEX IF NOT EXISTS idx_files_status ON files (status, created_at);
+            """)
+            # Catalogs written before rows were keyed by relative path used the basename.
+            self._conn.execute("UPDATE OR IGNORE files SET filename = path WHERE filename != path")
+            self._conn.commit()
+        return self._conn
+
+    def record_upload(self, filename: str, path: str, language: str, collection: str, sha256: str, size: int, status: str = "ingesting"):
+        """Insert or replace the row for a (re)uploaded file; counts are filled in by mark_ingested."""
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                """INSERT INTO files (filename, title, path, language, collection, sha256, size, status, created_at, updated_at)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                   ON CONFLICT(filename) DO UPDATE SET
+                       path = excluded.path, language = excluded.language, collection = excluded.collection,
+                       sha256 = excluded.sha256, size = excluded.size, pages = 0, chunks = 0,
+                       status = excluded.status, error = NULL, updated_at = excluded.updated_at""",
+                (filename, os.path.splitext(os.path.basename(filename))[0], path, language, collection, sha256, size, status, now, now)
+            )
+            conn.commit()
+
+    def mark_ingested(self, filename: str, pages: int, chunks: int):
+        self._update(filename, pages=pages, chunks=chunks, status="ingested", error=None)
+
+    def mark_failed(self, filename: str, error: str):
+        self._update(filename, status="failed", error=error)
+
+    def mark_deleted(self, filename: str):
+        """The file's graph data is gone but the PDF is still on disk."""
+        self._update(filename, chunks=0, status="deleted")
+
+    def record_hash(self, filename: str, sha256: str):
+        self._update(filename, sha256=sha256)
+
+    def _update(self, filename: str, **fields):
+        fields["updated_at"] = time.time()
+        assignments = ", ".join(f"{column} = ?" for column in fields)
+        with self._lock:
+            conn = self._connection()
+            conn.execute(f"UPDATE files SET {assignments} WHERE filename = ?", (*fields.values(), filename))
+            conn.commit()
+
+    def remove(self, filename: str):
+        with self._lock:
+            conn = self._connection()
+            conn.execute("DELETE FROM files WHERE filename = ?", (filename,))
+            conn.commit()
+
+    def get(self, filename: str):
+        with self._lock:
+            row = self._connection().execute("SELECT * FROM files WHERE filename = ?", (filename,)).fetchone()
+        return dict(row) if row else None
+
+    def list(self, language=None, collection=None, status=None, search=None, offset: int = 0, limit: int = 50):
+        """Newest first; returns (total matching rows, one page of rows)."""
+        clauses, params = [], []
+        for column, value in (("language", language), ("collection", collection), ("status", status)):
+            if value:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        if search:
+            clauses.append("title LIKE ?")
+            params.append(f"%{search}%")
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        with self._lock:
+            conn = self._connection()
+            total = conn.execute(f"SELECT COUNT(*) FROM files {where}", params).fetchone()[0]
+            rows = conn.execute(
+                f"SELECT * FROM files {where} ORDER BY created_at DESC, filename LIMIT ? OFFSET ?", (*params, limit, offset)
+            ).fetchall()
+        return total, [dict(row) for row in rows]
+
+    def import_directory(self, upload_dir: str) -> int:
+        """Catalogue PDFs that were uploaded before the catalog existed; their ingest status is unknown."""
+        with self._lock:
+            known = {row[0] for row in self._connection().execute("SELECT path FROM files")}
+        added = 0
+        for root, dirs, files in os.walk(upload_dir):
+            for file in files:
+                if not file.endswith('.pdf'):
+                    continue
+                full_path = os.path.join(root, file)
+                path = os.path.relpath(full_path, upload_dir).replace("\\", "/")
+                if path in known:
+                    continue
+                relative_dir = os.path.relpath(root, upload_dir)
+                language = relative_dir.split(os.sep)[0] if relative_dir != "." else "unknown"
+                # Unhashed until first downloaded; keyed by the relative path like Document.source_file.
+                with self._lock:
+                    conn = self._connection()
+                    now = os.path.getmtime(full_path)
+                    cursor = conn.execute(
+                        """INSERT OR IGNORE INTO files (filename, title, path, language, size, status, created_at, updated_at)
+                           VALUES (?, ?, ?, ?, ?, 'unknown', ?, ?)""",
+                        (path, os.path.splitext(file)[0], path, language, os.path.getsize(full_path), now, now)
+                    )
+                    conn.commit()
+                added += cursor.rowcount
+        if added:
+            logging.info(f"File catalog: imported {added} existing files from {upload_dir}")
+        return added
+
+    def stats(self):
+        with self._lock:
+            rows = self._connection().execute("SELECT status, COUNT(*), SUM(size) FROM files GROUP BY status").fetchall()
+        return {status: {"files": count, "bytes": size or 0} for status, count, size in rows}
+
+file_catalog = FileCatalog(FILE_CATALOG_PATH)
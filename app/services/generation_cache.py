@@ -0,0 +1,155 @@
+import asyncio
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from core import metrics
+from core.config import CACHE_ENABLED, CACHE_PATH, CACHE_TTL_SECONDS, CACHE_MAX_ENTRIES, SEMANTIC_CACHE_ENABLED
+from services import ollama_client
+from services.semantic_cache import semantic_cache, SemanticCache
+from services.singleflight import SingleFlight
+
+class GenerationCache:
+    """SQLite-backed cache of parsed generation results with TTL and LRU eviction."""
+
+    def __init__(self, path: str, ttl_seconds: float, max_entries: int):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _connection(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS generation_cache (
+                    key TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_generation_cache_accessed ON generation_cache (accessed_at)")
+        return self._conn
+
+    @staticmethod
+    def make_key(**parts) -> str:
+        return hashlib.sha256(json.dumps(parts, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+    def get(self, key: str):
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            row = conn.execute("SELECT value, created_at FROM generation_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if self.ttl_seconds and now - row[1] > self.ttl_seconds:
+                conn.execute("DELETE FROM generation_cache WHERE key = ?", (key,))
+                conn.commit()
+                return None
+            conn.execute("UPDATE generation_cache SET accessed_at = ? WHERE key = ?", (now, key))
+            conn.commit()
+        return json.loads(row[0])
+
+    def set(self, key: str, kind: str, value):
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                "INSERT OR REPLACE INTO generation_cache (key, kind, value, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, kind, json.dumps(value, ensure_ascii=False), now, now)
+            )
+            overflow = conn.execute("SELECT COUNT(*) FROM generation_cache").fetchone()[0] - self.max_entries
+            if overflow > 0:
+                conn.execute(
+                    "DELETE FROM generation_cache WHERE key IN (SELECT key FROM generation_cache ORDER BY accessed_at ASC LIMIT ?)",
+                    (overflow,)
+                )
+            conn.commit()
+
+    def stats(self):
+        with self._lock:
+            rows = self._connection().execute("SELECT kind, COUNT(*) FROM generation_cache GROUP BY kind").fetchall()
+        return {
+            "enabled": CACHE_ENABLED,
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "entries": dict(rows)
+        }
+
+generation_cache = GenerationCache(CACHE_PATH, CACHE_TTL_SECONDS, CACHE_MAX_ENTRIES)
+generation_flights = SingleFlight()
+
+def context_hash(context: str) -> str:
+    return hashlib.sha256(context.encode("utf-8")).hexdigest()
+
+async def embed_request(text: str):
+    try:
+        return SemanticCache.normalize(await ollama_client.embeddings(" ".join(text.lower().split())))
+    except Exception as e:
+        logging.warning(f"Request embedding failed, skipping semantic cache: {e}")
+        return None
+
+async def cached_generate(kind: str, key_parts: dict, producer, fresh: bool = False, semantic=None):
+    """Serve a stored result for identical or near-identical requests, otherwise run producer and store its result.
+
+    semantic is an optional {"text": ..., "partition": {...}} describing the request
+    for the similarity lookup; only requests in the same partition can match.
+    Concurrent misses for the same key share a single producer call.
+    """
+    key = GenerationCache.make_key(kind=kind, **key_parts)
+    if CACHE_ENABLED and not fresh:
+        try:
+            cached = await asyncio.to_thread(generation_cache.get, key)
+        except sqlite3.Error as e:
+            logging.warning(f"Generation cache lookup failed: {e}")
+            cached = None
+        if cached is not None:
+            metrics.increment("cache_requests_total", kind=kind, result="hit")
+            cached.setdefault("metadata", {})["cache"] = "hit"
+            return cached
+
+    result, waiters = await generation_flights.do(
+        f"{key}:{'fresh' if fresh else 'cached'}",
+        lambda: generate_and_store(kind, key, producer, fresh, semantic)
+    )
+    if waiters:
+        metrics.increment("coalesced_requests_total", kind=kind)
+    result.setdefault("metadata", {})["coalesced_waiters"] = waiters
+    return result
+
+async def generate_and_store(kind: str, key: str, producer, fresh: bool, semantic):
+    if not CACHE_ENABLED:
+        return await producer()
+
+    vector, partition = None, None
+    if semantic and SEMANTIC_CACHE_ENABLED:
+        scope = semantic["partition"]
+        version = await asyncio.to_thread(semantic_cache.content_version, scope.get("collection"), scope.get("language"))
+        partition = json.dumps({"kind": kind, "version": version, **scope}, sort_keys=True)
+        vector = await embed_request(semantic["text"])
+    if vector is not None and not fresh:
+        match = await asyncio.to_thread(semantic_cache.search, partition, vector)
+        if match is not None:
+            cached, similarity = match
+            metrics.increment("cache_requests_total", kind=kind, result="semantic_hit")
+            cached.setdefault("metadata", {}).update({"cache": "semantic", "similarity": round(similarity, 4)})
+            return cached
+
+    metrics.increment("cache_requests_total", kind=kind, result="bypass" if fresh else "miss")
+    result = await producer()
+    if result and result.get("total_questions"):
+        stored = {k: v for k, v in result.items() if k != "metadata"}
+        try:
+            await asyncio.to_thread(generation_cache.set, key, kind, stored)
+            if vector is not None:
+                await asyncio.to_thread(semantic_cache.add, partition, vector, stored)
+        except sqlite3.Error as e:
+            logging.warning(f"Generation cache write failed: {e}")
+    result.setdefault("metadata", {})["cache"] = "bypass" if fresh else "miss"
+    return result
@@ -1,13 +1,22 @@
+import asyncio
 import json
+import math
 import re
-import ollama
 from fastapi import HTTPException
 from utils.mcq_json import parse_mcq_text
-from core.config import OLLAMA_HOST, OLLAMA_MODEL
+from utils.stream_parser import IncrementalQuestionParser, ParsedStream
+from utils.json_stream import IncrementalJSONItemParser
+from utils.helpers import extract_num_questions, with_num_questions, split_context, merge_question_sets
+from utils.dedup import dedupe_questions
+from models.schemas import MCQItem
+from core.config import OLLAMA_MODEL, MCQ_BATCH_SIZE, MCQ_MIN_BATCH_SIZE, GENERATION_JSON_MODE, DEDUP_THRESHOLD, MCQ_DEDUP_TOPUP_RETRIES
+from core import metrics
+from services import ollama_client, replay
+from services.generation_cache import cached_generate, context_hash
+from services.token_budget import fit_prompt, record_usage
 
 class LLMService:
     def __init__(self):
-        ollama.base_url = OLLAMA_HOST
         self.model = OLLAMA_MODEL
 
     def format_mcq_prompt(self, question: str, context: str, num_questions=1, language='indonesian') -> str:
@@ -91,6 +100,28 @@ class LLMService:
             **Number of questions to generate: {num_questions}**
             """
 
+    def format_mcq_json_prompt(self, question: str, context: str, num_questions=1, language='indonesian') -> str:
+        shape = '{"questions": [{"question": "...", "options": {"A": "...", "B": "...", "C": "...", "D": "..."}, "answer": "A"}]}'
+        if language.lower() == "english":
+            return f"""You are an experienced lecturer. Create exactly {num_questions} high-quality multiple-choice questions based on the context below.
+
+            Respond ONLY with JSON of this shape: {shape}
+            - "options" MUST contain the four keys A, B, C and D.
+            - "answer" MUST be one of A, B, C or D, and correct answers must be spread across the four letters.
+
+            **Context:** {context}
+            **Task:** {question}
+            """
+        return f"""Anda adalah seorang dosen berpengalaman. Buatlah tepat {num_questions} soal pilihan ganda berkualitas tinggi berdasarkan konteks di bawah.
+
+            Jawab HANYA dengan JSON berbentuk: {shape}
+            - "options" WAJIB berisi empat kunci A, B, C, dan D.
+            - "answer" WAJIB salah satu dari A, B, C, atau D, dan jawaban benar harus tersebar di keempat huruf.
+
+            **Konteks:** {context}
+            **Permintaan:** {question}
+            """
+
     @staticmethod
     def enhance_content_format(content: str) -> str: 
         lines = content.split('\n')
@@ -128,40 +159,201 @@ class LLMService:
 
         return '\n'.join(enhanced_lines)
 
-    def generate_mcq(self, question: str, language: str, context: str):
-        try:
-            language = language.lower() if language else "indonesian"
-            num_questions = 10
-
-            num_match = re.search(r'(\d+)\s*(soal|pertanyaan|question)', question, re.IGNORECASE)
-            if num_match:
-                num_questions = int(num_match.group(1))
-
-            prompt = self.format_mcq_prompt(question, context, num_questions, language)
-            response = ollama.chat(model=self.model, messages=[{'role': 'user', 'content': prompt}])
-            content = response['message']['content']
-            parsed_json = parse_mcq_text(content)
-
-            if parsed_json["total_questions"] < num_questions:
+    @staticmethod
+    def plan_batches(num_questions: int):
+        """Split a request into sub-batch sizes, using smaller batches when the backend has spare capacity."""
+        batch_size = min(MCQ_BATCH_SIZE, max(MCQ_MIN_BATCH_SIZE, math.ceil(num_questions / ollama_client.capacity())))
+        num_batches = max(1, math.ceil(num_questions / batch_size))
+        base, extra = divmod(num_questions, num_batches)
+        return [base + (1 if i < extra else 0) for i in range(num_batches)]
+
+    async def generate_mcq_batch_json(self, question: str, language: str, context: str, num_questions: int):
+        prompt, options, budget = fit_prompt(
+            self.model, lambda c: self.format_mcq_json_prompt(question, c, num_questions, language), question, context, "mcq", num_questions
+        )
+        parsed = ParsedStream(IncrementalJSONItemParser(MCQItem, "mcq"), num_questions)
+        with replay.tag(kind="mcq", language=language, num_questions=num_questions):
+            stream = await ollama_client.chat([{'role': 'user', 'content': prompt}], model=self.model, stream=True, format='json', options=options)
+        questions = await parsed.collect(stream)
+        record_usage("mcq", budget, parsed.usage(), len(questions))
+        return {
+            "total_questions": len(questions),
+            "questions": questions
+        }
+
+    async def generate_mcq_batch(self, question: str, language: str, context: str, num_questions: int, json_mode: bool = False):
+        if json_mode:
+            try:
+                parsed_json = await self.generate_mcq_batch_json(question, language, context, num_questions)
+            except HTTPException:
+                raise
+            except Exception as e:
+                print(f"JSON generation failed, falling back to text: {str(e)}")
+                parsed_json = None
+            if parsed_json and parsed_json["total_questions"]:
+                path = "json" if parsed_json["total_questions"] >= num_questions else "json_partial"
+                metrics.increment("generation_path_total", kind="mcq", path=path)
+                return parsed_json
+            metrics.increment("generation_path_total", kind="mcq", path="regex_fallback")
+        else:
+            metrics.increment("generation_path_total", kind="mcq", path="regex")
+
+        prompt, options, budget = fit_prompt(
+            self.model, lambda c: self.format_mcq_prompt(question, c, num_questions, language), question, context, "mcq", num_questions
+        )
+        parsed = ParsedStream(IncrementalQuestionParser("mcq", language), num_questions)
+        with replay.tag(kind="mcq", language=language, num_questions=num_questions):
+            stream = await ollama_client.chat([{'role': 'user', 'content': prompt}], model=self.model, stream=True, options=options)
+        await parsed.collect(stream)
+        content = parsed.content
+        with metrics.timer(stage="parse", kind="mcq", format="text_full"):
+            parsed_json = parse_mcq_text(content, language)
+
+        if parsed_json["total_questions"] < num_questions:
+            metrics.increment("generation_path_total", kind="mcq", path="reformat_fallback")
+            with metrics.timer(stage="parse", kind="mcq", format="text_reformat"):
                 enhanced_content = self.enhance_content_format(content)
-                parsed_json = parse_mcq_text(enhanced_content)
+                parsed_json = parse_mcq_text(enhanced_content, language)
+
+        record_usage("mcq", budget, parsed.usage(), parsed_json["total_questions"])
+        return parsed_json
+
+    async def generate_mcq(self, question: str, language: str, context: str, json_mode=None, fresh: bool = False, collection=None):
+        language = language.lower() if language else "indonesian"
+        json_mode = GENERATION_JSON_MODE if json_mode is None else json_mode
+        key_parts = {
+            "question": " ".join(question.lower().split()),
+            "language": language,
+            "context": context_hash(context),
+            "model": self.model,
+            "options": {"json_mode": json_mode, "batch_size": MCQ_BATCH_SIZE, "min_batch_size": MCQ_MIN_BATCH_SIZE}
+        }
+        semantic = {
+            "text": question,
+            # No context hash: a reworded question retrieves other chunks and could never hit.
+            # The content version added by cached_generate covers uploads and deletes instead.
+            "partition": {
+                "collection": collection or "default",
+                "language": language,
+                "num_questions": extract_num_questions(question),
+                "model": self.model,
+                "json_mode": json_mode
+            }
+        }
+        return await cached_generate(
+            "mcq", key_parts, lambda: self.generate_mcq_uncached(question, language, context, json_mode), fresh, semantic
+        )
 
+    async def generate_mcq_uncached(self, question: str, language: str, context: str, json_mode: bool):
+        try:
+            num_questions = extract_num_questions(question)
+            batches = self.plan_batches(num_questions)
+
+            if len(batches) == 1:
+                parsed_json = await self.generate_mcq_batch(question, language, context, num_questions, json_mode)
+                return json.loads(json.dumps(parsed_json))
+
+            print(f"Splitting {num_questions} questions into {len(batches)} sub-batches: {batches}")
+            slots = asyncio.Semaphore(ollama_client.capacity())
+            contexts = split_context(context, len(batches))
+
+            async def run_batch(size, batch_context):
+                async with slots:
+                    return await self.generate_mcq_batch(with_num_questions(question, size), language, batch_context, size, json_mode)
+
+            results = await asyncio.gather(
+                *(run_batch(size, batch_context) for size, batch_context in zip(batches, contexts)),
+                return_exceptions=True
+            )
+            parsed_sets = [r for r in results if not isinstance(r, Exception)]
+            for r in results:
+                if isinstance(r, Exception):
+                    print(f"Sub-batch failed in generate_mcq: {str(r)}")
+            if not parsed_sets:
+                raise results[0]
+
+            merged = merge_question_sets(parsed_sets)
+            questions, clusters = dedupe_questions(merged["questions"], threshold=DEDUP_THRESHOLD)
+            if clusters:
+                print(f"Dropped {sum(len(c) - 1 for c in clusters)} near-duplicate questions across sub-batches")
+
+            # Deduplication must not cost the caller questions: ask for the shortfall and
+            # deduplicate again, keeping the questions already accepted first.
+            topups = 0
+            while len(questions) < num_questions and topups < MCQ_DEDUP_TOPUP_RETRIES:
+                missing = num_questions - len(questions)
+                topups += 1
+                metrics.increment("generation_retries_total", kind="mcq", reason="dedup_topup")
+                try:
+                    extra = await self.generate_mcq_batch(with_num_questions(question, missing), language, context, missing, json_mode)
+                except HTTPException:
+                    raise
+                except Exception as e:
+                    print(f"Top-up batch failed in generate_mcq: {str(e)}")
+                    break
+                merged = merge_question_sets([{"questions": questions}, extra])
+                questions, _ = dedupe_questions(merged["questions"], threshold=DEDUP_THRESHOLD)
+            parsed_json = merge_question_sets([{"questions": questions}], num_questions)
             return json.loads(json.dumps(parsed_json))
 
+        except HTTPException:
+            raise
         except Exception as e:
             import traceback
             print(f"Error in generate_mcq: {str(e)}")
             print(traceback.format_exc())
             raise HTTPException(status_code=500, detail=f"Error processing LLM response: {str(e)}")
 
-    def generate_json_response(self, question: str, language: str, context: str, num_questions: int = 1):
+    async def stream_mcq(self, question: str, language: str, context: str, num_questions: int = 10, json_mode=None):
+        language = language.lower() if language else "indonesian"
+        json_mode = GENERATION_JSON_MODE if json_mode is None else json_mode
+
+        if json_mode:
+            prompt, options, budget = fit_prompt(
+                self.model, lambda c: self.format_mcq_json_prompt(question, c, num_questions, language), question, context, "mcq", num_questions
+            )
+            parser = IncrementalJSONItemParser(MCQItem, "mcq")
+            parsed = ParsedStream(parser, num_questions)
+            try:
+                with replay.tag(kind="mcq", language=language, num_questions=num_questions):
+                    stream = await ollama_client.chat([{'role': 'user', 'content': prompt}], model=self.model, stream=True, format='json', options=options)
+                async for item in parsed.items(stream):
+                    yield item
+                record_usage("mcq", budget, parsed.usage(), parser.count)
+            except HTTPException:
+                raise
+            except Exception as e:
+                print(f"JSON streaming failed: {str(e)}")
+            if parser.count:
+                metrics.increment("generation_path_total", kind="mcq", path="json" if parser.count >= num_questions else "json_partial")
+                return
+            metrics.increment("generation_path_total", kind="mcq", path="regex_fallback")
+        else:
+            metrics.increment("generation_path_total", kind="mcq", path="regex")
+
+        prompt, options, budget = fit_prompt(
+            self.model, lambda c: self.format_mcq_prompt(question, c, num_questions, language), question, context, "mcq", num_questions
+        )
+        parsed = ParsedStream(IncrementalQuestionParser("mcq", language), num_questions)
+        with replay.tag(kind="mcq", language=language, num_questions=num_questions):
+            stream = await ollama_client.chat([{'role': 'user', 'content': prompt}], model=self.model, stream=True, options=options)
+        async for item in parsed.items(stream):
+            yield item
+        record_usage("mcq", budget, parsed.usage(), parsed.parser.count)
+
+    async def generate_json_response(self, question: str, language: str, context: str, num_questions: int = 1):
         try:
-            prompt = self.format_mcq_prompt(question, context, num_questions, language)
-            response = ollama.chat(model=self.model, messages=[{'role': 'user', 'content': prompt}])
+            prompt, options, budget = fit_prompt(
+                self.model, lambda c: self.format_mcq_prompt(question, c, num_questions, language), question, context, "answer"
+            )
+            response = await ollama_client.chat([{'role': 'user', 'content': prompt}], model=self.model, options=options)
+            record_usage("answer", budget, response)
             return {
                 "response": response['message']['content'],
                 "type": "general_query"
             }
+        except HTTPException:
+            raise
         except Exception as e:
             print(f"Error in generate_json_response: {str(e)}")
             return None
@@ -1,18 +1,18 @@
-from core.dependencies import get_graph
 import logging
-from langchain_ollama import ChatOllama, OllamaEmbeddings
-from langchain_community.vectorstores import Neo4jVector
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.output_parsers import StrOutputParser
-from core.config import OLLAMA_HOST, OLLAMA_MODEL
+import os
+from core.config import NEO4J_DELETE_BATCH_SIZE, NEO4J_GC_BATCH_SIZE, UPLOAD_DIR
+from core import metrics
+import threading
+import time
 from services.llm_services import LLMService
-from fastapi.responses import JSONResponse
-from fastapi import FastAPI, HTTPException
 from services.essay_services import EssayService
-from utils.helpers import is_mcq_request
+from services.admission import AdmissionRejected
+from utils.helpers import is_mcq_request, upload_key
 
-def query_rag_system(question, vector_retriever, graph):
-    retrieved_docs = vector_retriever.invoke(question)
+async def query_rag_system(question, vector_retriever, graph, language="indonesian", json_mode=None, fresh=False):
+    # Includes embedding the question; the embedding call alone is its own "embedding" stage.
+    with metrics.timer(stage="retrieval"):
+        retrieved_docs = await vector_retriever.ainvoke(question)
     formatted_context = "\n\n".join(doc.page_content for doc in retrieved_docs)
 
     is_mcq = any(keyword in question.lower() for keyword in ['soal', 'pilihan ganda', 'mcq', 'multiple choice', 'pertanyaan'])
@@ -21,10 +21,11 @@ def query_rag_system(question, vector_retriever, graph):
     
     try:
         if is_mcq:
-            response = llm_service.generate_mcq(question, "indonesian", formatted_context)  # Added language parameter
+            response = await llm_service.generate_mcq(question, language, formatted_context, json_mode=json_mode, fresh=fresh)
         else:
-            response = llm_service.generate_json_response(question, "indonesian", formatted_context)  # Added language parameter
+            response = await llm_service.generate_json_response(question, language, formatted_context)
         
+        generation = (response or {}).pop("metadata", {})
         return {
             "status": "success",
             "query": question,
@@ -32,17 +33,22 @@ def query_rag_system(question, vector_retriever, graph):
             "metadata": {
                 "model": llm_service.model,
                 "document_chunks": len(retrieved_docs),
-                "type": "mcq" if is_mcq else "general"
+                "type": "mcq" if is_mcq else "general",
+                **generation
             }
         }
+    except AdmissionRejected:
+        raise
     except Exception as e:
         return {
             "status": "error", 
             "message": str(e)
         }
         
-def query_rag_essay(question, vector_retriever, graph, language):
-    retrieved_docs = vector_retriever.invoke(question)
+async def query_rag_essay(question, vector_retriever, graph, language, json_mode=None, fresh=False):
+    # Includes embedding the question; the embedding call alone is its own "embedding" stage.
+    with metrics.timer(stage="retrieval"):
+        retrieved_docs = await vector_retriever.ainvoke(question)
     formatted_context = "\n\n".join(doc.page_content for doc in retrieved_docs)
 
     is_essay = any(keyword in question.lower() for keyword in ['soal', 'essay', 'pertanyaan', 'question'])
@@ -51,9 +57,10 @@ def query_rag_essay(question, vector_retriever, graph, language):
     
     try:
         if is_essay:
-            response = essay_service.generate_essay(question, language, formatted_context)
+            response = await essay_service.generate_essay(question, formatted_context, json_mode=json_mode, fresh=fresh, language=language)
         else:
             pass
+        generation = (response or {}).pop("metadata", {})
         
         return {
             "status": "success",
@@ -62,17 +69,22 @@ def query_rag_essay(question, vector_retriever, graph, language):
             "metadata": {
                 "model": essay_service.model,
                 "document_chunks": len(retrieved_docs),
-                "type": "Essay" if is_essay else "General"
+                "type": "Essay" if is_essay else "General",
+                **generation
             }
         }
+    except AdmissionRejected:
+        raise
     except Exception as e:
         return {
             "status": "error", 
             "message": str(e)
         }
         
-def query_rag_mcq(question, vector_retriever, graph, language):
-    retrieved_docs = vector_retriever.invoke(question)
+async def query_rag_mcq(question, vector_retriever, graph, language, json_mode=None, fresh=False):
+    # Includes embedding the question; the embedding call alone is its own "embedding" stage.
+    with metrics.timer(stage="retrieval"):
+        retrieved_docs = await vector_retriever.ainvoke(question)
     formatted_context = "\n\n".join(doc.page_content for doc in retrieved_docs)
 
     is_mcq = is_mcq_request(question)
@@ -81,10 +93,11 @@ def query_rag_mcq(question, vector_retriever, graph, language):
 
     try:
         if is_mcq:
-            response = llm_service.generate_mcq(question, language, formatted_context)
+            response = await llm_service.generate_mcq(question, language, formatted_context, json_mode=json_mode, fresh=fresh)
         else:
-            response = llm_service.generate_json_response(question, language, formatted_context)
+            response = await llm_service.generate_json_response(question, language, formatted_context)
 
+        generation = (response or {}).pop("metadata", {})
         return {
             "status": "success",
             "query": question,
@@ -92,90 +105,139 @@ def query_rag_mcq(question, vector_retriever, graph, language):
             "metadata": {
                 "model": llm_service.model,
                 "document_chunks": len(retrieved_docs),
-                "type": "mcq" if is_mcq else "general"
+                "type": "mcq" if is_mcq else "general",
+                **generation
             }
         }
+    except AdmissionRejected:
+        raise
     except Exception as e:
         return {
             "status": "error", 
             "message": str(e)
         }
 
+# Idempotent; the MERGEs in add_graph_documents and deletion by file both rely on these.
+SCHEMA = [
+    "CREATE CONSTRAINT IF NOT EXISTS FOR (d:Document) REQUIRE d.id IS UNIQUE",
+    "CREATE CONSTRAINT IF NOT EXISTS FOR (e:__Entity__) REQUIRE e.id IS UNIQUE",
+    "CREATE INDEX document_source_file IF NOT EXISTS FOR (d:Document) ON (d.source_file)",
+]
+
+# Chunks ingested before source_file was recorded only carry the loader's path in `source`;
+# the key is the part after the upload directory (see utils.helpers.upload_key).
+BACKFILL_SOURCE_FILE = """
+MATCH (d:Document)
+WHERE d.source_file IS NULL AND d.source IS NOT NULL
+CALL {
+  WITH d
+  WITH d, replace(d.source, '\\\\', '/') AS path
+  SET d.source_file = CASE
+    WHEN path STARTS WITH $upload_dir + '/' THEN substring(path, size($upload_dir) + 1)
+    WHEN path CONTAINS '/' + $upload_dir + '/' THEN last(split(path, '/' + $upload_dir + '/'))
+    ELSE last(split(path, '/'))
+  END
+} IN TRANSACTIONS OF $batch_size ROWS
+"""
+
+DELETE_BY_SOURCE_FILE = """
+MATCH (d:Document {source_file: $source_file})
+CALL {
+  WITH d
+  OPTIONAL MATCH (d)-[r]-()
+  WITH d, count(r) AS relationships
+  DETACH DELETE d
+  RETURN relationships
+} IN TRANSACTIONS OF $batch_size ROWS
+RETURN count(*) AS nodes_deleted, coalesce(sum(relationships), 0) AS relationships_deleted
+"""
+
+MENTIONED_ENTITIES = """
+MATCH (:Document {source_file: $source_file})-[:MENTIONS]->(e:__Entity__)
+RETURN DISTINCT elementId(e) AS id
+"""
+
+# Only entities the deleted chunks mentioned can have become orphans; everything else is left unscanned.
+COLLECT_ORPHANS = """
+UNWIND $ids AS id
+MATCH (e:__Entity__) WHERE elementId(e) = id AND NOT EXISTS { (:Document)-[:MENTIONS]->(e) }
+WITH e, COUNT { (e)--() } AS relationships
+DETACH DELETE e
+RETURN count(e) AS entities_deleted, coalesce(sum(relationships), 0) AS relationships_deleted
+"""
+
+# Databases whose schema this process has already ensured.
+_schema_ready = set()
+_gc_lock = threading.Lock()
+last_gc_report = {}
+
+def ensure_schema(graph):
+    """Create constraints and the Document.source_file index and backfill legacy chunks, once per database and process."""
+    database = getattr(graph, "_database", None)
+    if database in _schema_ready:
+        return
+    for statement in SCHEMA:
+        graph.query(statement)
+    graph.query(BACKFILL_SOURCE_FILE, {"batch_size": NEO4J_DELETE_BATCH_SIZE, "upload_dir": os.path.basename(os.path.normpath(UPLOAD_DIR))})
+    _schema_ready.add(database)
+
 def delete_data_from_neo4j(name, graph):
-    logging.info(f"Attempting to delete data related to: {name}")
-    
+    """Delete every chunk ingested from file `name` (an upload key, see utils.helpers.upload_key).
+
+    Returns exact node and relationship counts, plus the ids of entities those chunks
+    mentioned for collect_orphan_entities.
+    """
+    source_file = upload_key(name)
+    logging.info(f"Attempting to delete data ingested from: {source_file}")
+
     try:
-        count_query = """
-        MATCH (n)
-        WHERE toLower(n.name) CONTAINS toLower($name) OR 
-              toLower(n.id) CONTAINS toLower($name) OR
-              (n.text IS NOT NULL AND toLower(n.text) CONTAINS toLower($name))
-        RETURN count(n) as count
-        """
-        
-        count_result = graph.query(count_query, {"name": name})
-        nodes_to_delete = count_result[0]["count"] if count_result else 0
-        
-        if nodes_to_delete == 0:
-            logging.info(f"No nodes found matching: {name}")
-            return 0
-
-        check_query = """
-        MATCH (n)
-        WHERE toLower(n.name) CONTAINS toLower($name) OR 
-              toLower(n.id) CONTAINS toLower($name) OR
-              (n.text IS NOT NULL AND toLower(n.text) CONTAINS toLower($name))
-        RETURN n.name, n.id, labels(n) as labels
-        LIMIT 10
-        """
-        
-        check_result = graph.query(check_query, {"name": name})
-        logging.info(f"Found {len(check_result)} sample nodes matching '{name}':")
-        for node in check_result:
-            logging.info(f"  - {node}")
-            
-        relationships_query = """
-        MATCH (n)-[r]-(m)
-        WHERE toLower(n.name) CONTAINS toLower($name) OR 
-              toLower(n.id) CONTAINS toLower($name) OR
-              (n.text IS NOT NULL AND toLower(n.text) CONTAINS toLower($name))
-        DELETE r
-        """
-        
-        graph.query(relationships_query, {"name": name})
-        logging.info(f"Deleted relationships connected to nodes matching: {name}")
-        
-        delete_query = """
-        MATCH (n)
-        WHERE toLower(n.name) CONTAINS toLower($name) OR 
-              toLower(n.id) CONTAINS toLower($name) OR
-              (n.text IS NOT NULL AND toLower(n.text) CONTAINS toLower($name))
-        DELETE n
-        """
-        
-        graph.query(delete_query, {"name": name})
-        
-        verify_query = """
-        MATCH (n)
-        WHERE toLower(n.name) CONTAINS toLower($name) OR 
-              toLower(n.id) CONTAINS toLower($name) OR
-              (n.text IS NOT NULL AND toLower(n.text) CONTAINS toLower($name))
-        RETURN count(n) as remaining
-        """
-        
-        verify_result = graph.query(verify_query, {"name": name})
-        remaining = verify_result[0]["remaining"] if verify_result else 0
-        
-        deleted_count = nodes_to_delete - remaining
-        
-        if remaining > 0:
-            logging.warning(f"Deletion incomplete. {remaining} nodes still remain.")
+        ensure_schema(graph)
+        mentioned = [row["id"] for row in graph.query(MENTIONED_ENTITIES, {"source_file": source_file})]
+        result = graph.query(DELETE_BY_SOURCE_FILE, {"source_file": source_file, "batch_size": NEO4J_DELETE_BATCH_SIZE})
+        counts = dict(result[0]) if result else {"nodes_deleted": 0, "relationships_deleted": 0}
+        counts["mentioned_entities"] = mentioned
+
+        if counts["nodes_deleted"] == 0:
+            logging.info(f"No chunks found for: {source_file}")
         else:
-            logging.info("Deletion verified. No matching nodes remain.")
-        
-        logging.info(f"Successfully deleted {deleted_count} nodes matching: {name}")
-        return deleted_count
-        
+            logging.info(
+                f"Deleted {counts['nodes_deleted']} chunks and {counts['relationships_deleted']} "
+                f"relationships from: {source_file}"
+            )
+        return counts
+
     except Exception as e:
-        logging.error(f"Error deleting data for '{name}': {str(e)}")
-        raise
\ No newline at end of file
+        logging.error(f"Error deleting data for '{source_file}': {str(e)}")
+        raise
+
+def collect_orphan_entities(entity_ids, graph, source_file=None, batch_size: int = NEO4J_GC_BATCH_SIZE):
+    """Delete entities in entity_ids that no Document mentions any more, one bounded batch per transaction."""
+    global last_gc_report
+    started = time.monotonic()
+    entities, relationships = 0, 0
+    # Overlapping collections would only race over the same candidates; run them one at a time.
+    with _gc_lock:
+        try:
+            for i in range(0, len(entity_ids), batch_size):
+                result = graph.query(COLLECT_ORPHANS, {"ids": entity_ids[i:i + batch_size]})
+                if result:
+                    entities += result[0]["entities_deleted"]
+                    relationships += result[0]["relationships_deleted"]
+        except Exception as e:
+            logging.error(f"Orphan entity collection for '{source_file}' stopped early: {str(e)}")
+        finally:
+            last_gc_report = {
+                "source_file": source_file,
+                "candidates": len(entity_ids),
+                "entities_deleted": entities,
+                "relationships_deleted": relationships,
+                "seconds": round(time.monotonic() - started, 3),
+                "finished_at": time.time(),
+            }
+            metrics.increment("graph_gc_entities_deleted_total", entities)
+            metrics.increment("graph_gc_relationships_deleted_total", relationships)
+    logging.info(
+        f"Reclaimed {entities} orphan entities and {relationships} relationships "
+        f"out of {len(entity_ids)} candidates from '{source_file}'"
+    )
+    return last_gc_report
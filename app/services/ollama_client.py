@@ -0,0 +1,347 @@
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+import httpx
+import ollama
+from core import metrics
+from services import replay
+from services.admission import admission
+from core.config import (
+    OLLAMA_HOSTS,
+    OLLAMA_MODEL,
+    OLLAMA_TIMEOUT,
+    OLLAMA_MAX_CONNECTIONS,
+    OLLAMA_MAX_KEEPALIVE,
+    OLLAMA_KEEPALIVE_EXPIRY,
+    OLLAMA_HEALTH_INTERVAL,
+    OLLAMA_EJECT_AFTER_FAILURES,
+    OLLAMA_EJECT_SECONDS,
+    EMBEDDING_MODEL,
+    OLLAMA_KEEP_ALIVE,
+)
+
+class OllamaHost:
+    """One backend with its own keep-alive connection pool and concurrency limit."""
+
+    def __init__(self, url: str, limit: int):
+        self.url = url
+        self.limit = max(1, limit)
+        self.outstanding = 0
+        self.failures = 0
+        self.ejected_until = 0.0
+        self._client = None
+        self._sync_client = None
+
+    @property
+    def client(self) -> ollama.AsyncClient:
+        # One AsyncClient per host and worker process so every generation shares the
+        # same keep-alive connection pool instead of opening a socket per request.
+        if self._client is None:
+            self._client = ollama.AsyncClient(
+                host=self.url,
+                timeout=httpx.Timeout(OLLAMA_TIMEOUT, connect=10.0),
+                limits=httpx.Limits(
+                    max_connections=OLLAMA_MAX_CONNECTIONS,
+                    max_keepalive_connections=OLLAMA_MAX_KEEPALIVE,
+                    keepalive_expiry=OLLAMA_KEEPALIVE_EXPIRY,
+                ),
+            )
+            logging.info(f"Created Ollama client for {self.url}")
+        return self._client
+
+    @property
+    def sync_client(self) -> ollama.Client:
+        if self._sync_client is None:
+            self._sync_client = ollama.Client(host=self.url, timeout=httpx.Timeout(OLLAMA_TIMEOUT, connect=10.0))
+        return self._sync_client
+
+    @property
+    def healthy(self) -> bool:
+        return time.monotonic() >= self.ejected_until
+
+    async def close(self):
+        if self._client is not None:
+            await self._client._client.aclose()
+            self._client = None
+        if self._sync_client is not None:
+            self._sync_client._client.close()
+            self._sync_client = None
+
+class HostPool:
+    """Routes each call to the healthy host with the fewest outstanding requests.
+
+    A host is ejected for OLLAMA_EJECT_SECONDS after OLLAMA_EJECT_AFTER_FAILURES
+    consecutive connection or server errors, and the background probe puts it back
+    as soon as it answers again. When every host is ejected, calls still go to the
+    least loaded one rather than failing outright.
+    """
+
+    def __init__(self, hosts):
+        self.hosts = [OllamaHost(url, limit) for url, limit in hosts]
+        self._lock = threading.Lock()
+        self._waiters = deque()
+        self._probe_task = None
+
+    def _select(self, respect_limit: bool):
+        candidates = [h for h in self.hosts if h.healthy] or self.hosts
+        if respect_limit:
+            candidates = [h for h in candidates if h.outstanding < h.limit]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda h: (h.outstanding / h.limit, h.outstanding))
+
+    async def acquire(self) -> OllamaHost:
+        while True:
+            with self._lock:
+                host = self._select(respect_limit=True)
+                if host is not None:
+                    host.outstanding += 1
+                    return host
+                waiter = asyncio.get_running_loop().create_future()
+                self._waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                with self._lock:
+                    if waiter in self._waiters:
+                        self._waiters.remove(waiter)
+                    else:
+                        # We were already picked to take a free slot; pass it on.
+                        self._wake_one()
+                raise
+
+    def claim(self) -> OllamaHost:
+        """Pick a host for a synchronous caller without waiting for a free slot."""
+        with self._lock:
+            host = self._select(respect_limit=False)
+            host.outstanding += 1
+            return host
+
+    def release(self, host: OllamaHost, failed: bool = False):
+        with self._lock:
+            host.outstanding -= 1
+            if failed:
+                self._record_failure(host)
+            else:
+                host.failures = 0
+            self._wake_one()
+
+    def _wake_one(self):
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.get_loop().call_soon_threadsafe(self._resolve, waiter)
+                return
+
+    @staticmethod
+    def _resolve(waiter):
+        if not waiter.done():
+            waiter.set_result(None)
+
+    def _record_failure(self, host: OllamaHost):
+        host.failures += 1
+        if host.failures >= OLLAMA_EJECT_AFTER_FAILURES and host.healthy:
+            host.ejected_until = time.monotonic() + OLLAMA_EJECT_SECONDS
+            metrics.increment("ollama_host_ejections_total", host=host.url)
+            logging.warning(f"Ejected Ollama host {host.url} after {host.failures} consecutive failures")
+
+    async def probe(self):
+        for host in self.hosts:
+            try:
+                await asyncio.wait_for(host.client.list(), timeout=5.0)
+            except Exception as e:
+                with self._lock:
+                    self._record_failure(host)
+                logging.debug(f"Health probe failed for {host.url}: {e}")
+                continue
+            with self._lock:
+                if not host.healthy:
+                    logging.info(f"Ollama host {host.url} is healthy again")
+                host.failures = 0
+                host.ejected_until = 0.0
+                self._wake_one()
+
+    async def _probe_loop(self):
+        while True:
+            await self.probe()
+            await asyncio.sleep(OLLAMA_HEALTH_INTERVAL)
+
+    def start_probing(self):
+        if self._probe_task is None and len(self.hosts) > 1:
+            self._probe_task = asyncio.create_task(self._probe_loop())
+
+    def capacity(self) -> int:
+        healthy = [h for h in self.hosts if h.healthy] or self.hosts
+        return sum(h.limit for h in healthy)
+
+    def stats(self):
+        with self._lock:
+            return [
+                {
+                    "url": h.url,
+                    "limit": h.limit,
+                    "outstanding": h.outstanding,
+                    "healthy": h.healthy,
+                    "consecutive_failures": h.failures
+                }
+                for h in self.hosts
+            ]
+
+    async def close(self):
+        if self._probe_task is not None:
+            self._probe_task.cancel()
+            self._probe_task = None
+        for host in self.hosts:
+            await host.close()
+
+pool = HostPool(OLLAMA_HOSTS)
+
+def is_host_failure(error: Exception) -> bool:
+    """Connection problems and 5xx responses count against a host; bad requests do not."""
+    if isinstance(error, ollama.ResponseError):
+        return error.status_code >= 500
+    return isinstance(error, (httpx.TransportError, ConnectionError, asyncio.TimeoutError))
+
+def _record_timings(host: OllamaHost, model: str, final):
+    """Ollama's own prefill/decode split and token counts from the final chunk of a generation."""
+    for stage, field in (("ollama_load", "load_duration"), ("ollama_prefill", "prompt_eval_duration"), ("ollama_decode", "eval_duration")):
+        if final.get(field):
+            metrics.observe("stage_duration_seconds", final[field] / 1e9, stage=stage, model=model)
+    metrics.increment("ollama_prompt_tokens_total", final.get("prompt_eval_count", 0), model=model, host=host.url)
+    metrics.increment("ollama_eval_tokens_total", final.get("eval_count", 0), model=model, host=host.url)
+
+async def _release_after_stream(host: OllamaHost, stream, started: float, model: str, capture=None):
+    failed, stopped, tokens = False, None, 0
+    parts, final = [], {}
+    try:
+        async for chunk in stream:
+            if chunk.get('done'):
+                final = chunk
+            else:
+                if tokens == 0:
+                    metrics.observe("ollama_time_to_first_token_seconds", time.monotonic() - started, model=model)
+                tokens += 1
+            if capture:
+                parts.append(chunk['message']['content'])
+            yield chunk
+    except asyncio.CancelledError:
+        stopped = "cancelled"
+        raise
+    except GeneratorExit:
+        # The caller closed the stream because it already has everything it needs.
+        stopped = "early_stop"
+        raise
+    except Exception as e:
+        failed = is_host_failure(e)
+        raise
+    finally:
+        if stopped:
+            # Ollama streams one token per chunk, and closing the stream makes it stop generating.
+            metrics.increment("generations_stopped_total", reason=stopped)
+            # Only an estimate of the tokens generated, so kept out of ollama_eval_tokens_total.
+            metrics.increment("ollama_stopped_chunks_total", tokens, model=model, host=host.url, reason=stopped)
+            logging.info(f"Generation on {host.url} stopped ({stopped}) after {tokens} tokens")
+        elif final:
+            _record_timings(host, model, final)
+        if capture and not failed and stopped != "cancelled":
+            replay.record(*capture, ''.join(parts), final, stopped)
+        pool.release(host, failed)
+        admission.release(time.monotonic() - started)
+
+async def _collect(stream):
+    parts, final = [], {}
+    async for chunk in stream:
+        parts.append(chunk['message']['content'])
+        if chunk.get('done'):
+            final = chunk
+    return {**final, 'message': {'role': 'assistant', 'content': ''.join(parts)}}
+
+async def chat(messages, model: str = OLLAMA_MODEL, stream: bool = False, format: str = '', options=None):
+    """Chat completion through the admission queue and host pool.
+
+    Ollama is always asked to stream so that a cancelled caller closes the connection
+    mid-generation and the tokens produced so far can be counted; non-streaming callers
+    get the chunks assembled into the usual single response.
+    """
+    await admission.acquire()
+    started = time.monotonic()
+    try:
+        host = await pool.acquire()
+    except BaseException:
+        admission.release()
+        raise
+    metrics.increment("ollama_requests_total", host=host.url, call="chat")
+    try:
+        response = await host.client.chat(
+            model=model,
+            messages=messages,
+            stream=True,
+            format=format,
+            options=options,
+        )
+    except BaseException as e:
+        pool.release(host, isinstance(e, Exception) and is_host_failure(e))
+        admission.release(time.monotonic() - started)
+        raise
+    tags = replay.current_tags()
+    capture = (tags, model, messages, format, options) if tags else None
+    chunks = _release_after_stream(host, response, started, model, capture)
+    if stream:
+        return chunks
+    return await _collect(chunks)
+
+async def embeddings(prompt: str, model: str = EMBEDDING_MODEL):
+    host = await pool.acquire()
+    metrics.increment("ollama_requests_total", host=host.url, call="embeddings")
+    failed = False
+    try:
+        with metrics.timer(stage="embedding", model=model):
+            response = await host.client.embeddings(model=model, prompt=prompt)
+    except Exception as e:
+        failed = is_host_failure(e)
+        raise
+    finally:
+        pool.release(host, failed)
+    return response["embedding"]
+
+def embeddings_sync(prompt: str, model: str = EMBEDDING_MODEL):
+    host = pool.claim()
+    metrics.increment("ollama_requests_total", host=host.url, call="embeddings")
+    failed = False
+    try:
+        with metrics.timer(stage="embedding", model=model):
+            response = host.sync_client.embeddings(model=model, prompt=prompt)
+    except Exception as e:
+        failed = is_host_failure(e)
+        raise
+    finally:
+        pool.release(host, failed)
+    return response["embedding"]
+
+async def warm_up_host(host: OllamaHost, model: str = OLLAMA_MODEL, embedding_model: str = EMBEDDING_MODEL):
+    """Run a one-token generation on host, then pin the chat and embedding models for OLLAMA_KEEP_ALIVE."""
+    await host.client.chat(model=model, messages=[{"role": "user", "content": "Halo"}], options={"num_predict": 1})
+    # ollama 0.1.5 has no keep_alive argument, so the preload goes straight to the REST API. It runs
+    # after the warm-up generation, which would otherwise reset the keep-alive to the server default.
+    for path, payload in (
+        ("/api/generate", {"model": model, "prompt": ""}),
+        ("/api/embeddings", {"model": embedding_model, "prompt": "warm up"}),
+    ):
+        response = await host.client._client.post(path, json={**payload, "stream": False, "keep_alive": OLLAMA_KEEP_ALIVE})
+        response.raise_for_status()
+
+async def warm_up():
+    """Warm every configured host; raises if any of them could not be warmed."""
+    results = await asyncio.gather(*(warm_up_host(host) for host in pool.hosts), return_exceptions=True)
+    errors = [f"{host.url}: {result}" for host, result in zip(pool.hosts, results) if isinstance(result, Exception)]
+    if errors:
+        raise RuntimeError("; ".join(errors))
+
+def capacity() -> int:
+    """Number of generations the healthy backends can run in parallel."""
+    return max(1, pool.capacity())
+
+async def close_client():
+    await pool.close()
@@ -1,14 +1,19 @@
-import os
+import asyncio
+import hashlib
 import logging
-from langchain_community.document_loaders import PyPDFLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_experimental.graph_transformers import LLMGraphTransformer
-from langchain_ollama import ChatOllama
-from core.config import UPLOAD_DIR, OLLAMA_HOST, OLLAMA_MODEL
+from core.config import UPLOAD_DIR, OLLAMA_MODEL
+from services import ollama_client
+from services.admission import admission, INGESTION
+from services.neo4j_operations import ensure_schema
+from core.dependencies import refresh_vector_retriever
+from utils.helpers import upload_key
 
 logging.basicConfig(level=logging.INFO)
 
 def load_pdf(file_path):
+    # The PDF and splitting stack is only needed by ingest workers, so it is imported on first use.
+    from langchain_community.document_loaders import PyPDFLoader
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
     logging.info(f"Loading PDF from: {file_path}")
     loader = PyPDFLoader(file_path)
     documents = loader.load()
@@ -19,16 +24,31 @@ def load_pdf(file_path):
     
     text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
     split_docs = text_splitter.split_documents(documents)
+    tag_chunks(split_docs, file_path)
     logging.info(f"Split into {len(split_docs)} chunks for processing")
     
     return split_docs
 
+def tag_chunks(chunks, file_path):
+    """Record the file's upload key on every chunk and give each chunk a per-file node id.
+
+    source_file lets a file's chunks be found (and deleted) through an index. Without an id,
+    Neo4jGraph keys chunks by the md5 of their text, so identical chunks of two files would merge.
+    """
+    source_file = upload_key(file_path)
+    for index, doc in enumerate(chunks):
+        doc.metadata["source_file"] = source_file
+        doc.metadata["id"] = hashlib.md5(f"{source_file}\n{index}\n{doc.page_content}".encode("utf-8")).hexdigest()
+    return chunks
+
 def store_documents(documents, graph):
+    from langchain_experimental.graph_transformers import LLMGraphTransformer
+    from langchain_ollama import ChatOllama
     logging.info(f"Starting ingestion process for {len(documents)} documents")
+    ensure_schema(graph)
     
-    llm = ChatOllama(model=OLLAMA_MODEL, base_url=OLLAMA_HOST, temperature=0)
-    llm_transformer_filtered = LLMGraphTransformer(llm=llm)
-    
+    # One transformer per pool host; each batch goes to the least loaded one.
+    transformers = {}
     batch_size = 5
     processed_docs = 0
     
@@ -37,7 +57,18 @@ def store_documents(documents, graph):
         logging.info(f"Processing batch {i//batch_size + 1}/{(len(documents)-1)//batch_size + 1}")
         
         try:
-            graph_documents = llm_transformer_filtered.convert_to_graph_documents(batch)
+            host = ollama_client.pool.claim()
+            failed = False
+            try:
+                if host.url not in transformers:
+                    llm = ChatOllama(model=OLLAMA_MODEL, base_url=host.url, temperature=0)
+                    transformers[host.url] = LLMGraphTransformer(llm=llm)
+                graph_documents = transformers[host.url].convert_to_graph_documents(batch)
+            except Exception as e:
+                failed = ollama_client.is_host_failure(e)
+                raise
+            finally:
+                ollama_client.pool.release(host, failed)
             
             graph.add_graph_documents(
                 graph_documents,
@@ -50,4 +81,22 @@ def store_documents(documents, graph):
             logging.error(f"Error processing batch {i//batch_size + 1}: {e}")
     
     logging.info(f"Successfully added {processed_docs} documents to the graph")
-    return processed_docs
\ No newline at end of file
+    return processed_docs
+
+async def ingest_documents(documents, graph, language: str = "indonesian", batch_size: int = 5):
+    """Run graph extraction off the event loop, taking one ingestion-priority admission slot per batch.
+
+    graph must be get_graph(language), the database the language's retriever reads. Ends by
+    embedding the new chunks in a worker thread, so neither the first query after an upload
+    nor a separate query worker has to (and the ingest role embeds on its own).
+    """
+    processed_docs = 0
+    for i in range(0, len(documents), batch_size):
+        async with admission.slot(INGESTION):
+            processed_docs += await asyncio.to_thread(store_documents, documents[i:i + batch_size], graph)
+    try:
+        embedded = await asyncio.to_thread(refresh_vector_retriever, language)
+        logging.info(f"The {language} retriever is up to date ({embedded} chunks embedded by this refresh)")
+    except Exception as e:
+        logging.error(f"Embedding new chunks for the {language} retriever failed: {e}")
+    return processed_docs
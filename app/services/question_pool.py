@@ -0,0 +1,237 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+import numpy as np
+from core.config import (
+    QUESTION_POOL_PATH,
+    QUESTION_POOL_SIZE,
+    QUESTION_POOL_LOW_WATERMARK,
+    QUESTION_POOL_SECTION_CHUNKS,
+    QUESTION_POOL_MATCH_THRESHOLD,
+)
+from services.admission import priority, INGESTION
+from services.generation_cache import embed_request
+from services.essay_services import EssayService
+from services.llm_services import LLMService
+from utils.helpers import normalize_question_text
+
+class QuestionPool:
+    """Pre-generated MCQ and essay items per document section, stored in SQLite.
+
+    Sections are groups of consecutive chunks of an uploaded document. A request
+    is served from the pool when its embedding is close enough to a section and
+    the section still has enough unused items of the requested kind.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _connection(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.executescript("""
+                CREATE TABLE IF NOT EXISTS pool_sections (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    document TEXT NOT NULL,
+                    collection TEXT NOT NULL DEFAULT '',
+                    language TEXT NOT NULL,
+                    section_index INTEGER NOT NULL,
+                    text TEXT NOT NULL,
+                    vector BLOB NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS pool_items (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    section_id INTEGER NOT NULL,
+                    kind TEXT NOT NULL,
+                    item TEXT NOT NULL,
+                    used INTEGER NOT NULL DEFAULT 0,
+                    created_at REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_pool_items_section ON pool_items (section_id, kind, used);
+            """)
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(pool_sections)")}
+            if "collection" not in columns:
+                # Pools built before sections were scoped by collection belong to the default one.
+                self._conn.execute("ALTER TABLE pool_sections ADD COLUMN collection TEXT NOT NULL DEFAULT ''")
+                self._conn.commit()
+        return self._conn
+
+    def add_section(self, document: str, language: str, section_index: int, text: str, vector, collection: str = "") -> int:
+        with self._lock:
+            conn = self._connection()
+            cursor = conn.execute(
+                "INSERT INTO pool_sections (document, collection, language, section_index, text, vector) VALUES (?, ?, ?, ?, ?, ?)",
+                (document, collection, language, section_index, text, vector.astype(np.float32).tobytes())
+            )
+            conn.commit()
+            return cursor.lastrowid
+
+    def delete_document(self, document: str):
+        with self._lock:
+            conn = self._connection()
+            conn.execute("DELETE FROM pool_items WHERE section_id IN (SELECT id FROM pool_sections WHERE document = ?)", (document,))
+            conn.execute("DELETE FROM pool_sections WHERE document = ?", (document,))
+            conn.commit()
+
+    def section(self, section_id: int):
+        with self._lock:
+            return self._connection().execute(
+                "SELECT id, document, language, text FROM pool_sections WHERE id = ?", (section_id,)
+            ).fetchone()
+
+    def best_section(self, language: str, vector, collection: str = ""):
+        """Closest section among the documents of one collection and language."""
+        with self._lock:
+            rows = self._connection().execute(
+                "SELECT id, vector FROM pool_sections WHERE language = ? AND collection = ?", (language, collection)
+            ).fetchall()
+        rows = [(section_id, np.frombuffer(blob, dtype=np.float32)) for section_id, blob in rows]
+        rows = [(section_id, v) for section_id, v in rows if v.shape == vector.shape]
+        if not rows:
+            return None, 0.0
+        similarities = np.vstack([v for _, v in rows]) @ vector
+        best = int(np.argmax(similarities))
+        return rows[best][0], float(similarities[best])
+
+    def unused_count(self, section_id: int, kind: str) -> int:
+        with self._lock:
+            return self._connection().execute(
+                "SELECT COUNT(*) FROM pool_items WHERE section_id = ? AND kind = ? AND used = 0", (section_id, kind)
+            ).fetchone()[0]
+
+    def add_items(self, section_id: int, kind: str, items) -> int:
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            existing = {
+                normalize_question_text(json.loads(row[0])["question"])
+                for row in conn.execute("SELECT item FROM pool_items WHERE section_id = ? AND kind = ?", (section_id, kind))
+            }
+            added = 0
+            for item in items:
+                key = normalize_question_text(item["question"])
+                if key in existing:
+                    continue
+                existing.add(key)
+                conn.execute(
+                    "INSERT INTO pool_items (section_id, kind, item, created_at) VALUES (?, ?, ?, ?)",
+                    (section_id, kind, json.dumps(item, ensure_ascii=False), now)
+                )
+                added += 1
+            conn.commit()
+            return added
+
+    def claim_items(self, section_id: int, kind: str, count: int):
+        with self._lock:
+            conn = self._connection()
+            rows = conn.execute(
+                "SELECT id, item FROM pool_items WHERE section_id = ? AND kind = ? AND used = 0 ORDER BY id LIMIT ?",
+                (section_id, kind, count)
+            ).fetchall()
+            if len(rows) < count:
+                return None
+            conn.executemany("UPDATE pool_items SET used = 1 WHERE id = ?", [(row[0],) for row in rows])
+            conn.commit()
+        return [json.loads(row[1]) for row in rows]
+
+    def stats(self):
+        with self._lock:
+            rows = self._connection().execute(
+                "SELECT kind, SUM(used = 0), SUM(used = 1) FROM pool_items GROUP BY kind"
+            ).fetchall()
+            sections = self._connection().execute("SELECT COUNT(*) FROM pool_sections").fetchone()[0]
+        return {
+            "sections": sections,
+            "items": {kind: {"unused": unused, "used": used} for kind, unused, used in rows}
+        }
+
+question_pool = QuestionPool(QUESTION_POOL_PATH)
+refilling = set()
+# Strong references to background refills; the event loop only keeps weak ones.
+refill_tasks = set()
+
+def pool_request(kind: str, language: str, num_questions: int) -> str:
+    if kind == "essay":
+        return f"Buatlah {num_questions} soal essay tentang materi ini"
+    if language == "english":
+        return f"Create {num_questions} questions about this material"
+    return f"Buatlah {num_questions} soal pilihan ganda tentang materi ini"
+
+async def refill_section(section_id: int, kind: str):
+    """Top a section's pool back up to QUESTION_POOL_SIZE unused items of one kind."""
+    if (section_id, kind) in refilling:
+        return
+    refilling.add((section_id, kind))
+    token = priority.set(INGESTION)
+    try:
+        row = await asyncio.to_thread(question_pool.section, section_id)
+        if row is None:
+            return
+        _, document, language, text = row
+        missing = QUESTION_POOL_SIZE - await asyncio.to_thread(question_pool.unused_count, section_id, kind)
+        if missing <= 0:
+            return
+
+        request = pool_request(kind, language, missing)
+        if kind == "essay":
+            generated = await EssayService().generate_essay_uncached(request, text, json_mode=False)
+        else:
+            generated = await LLMService().generate_mcq_uncached(request, language, text, json_mode=False)
+        added = await asyncio.to_thread(question_pool.add_items, section_id, kind, generated["questions"])
+        logging.info(f"Question pool: added {added} {kind} items to section {section_id} of {document}")
+    except Exception as e:
+        logging.error(f"Question pool refill failed for section {section_id} ({kind}): {e}")
+    finally:
+        priority.reset(token)
+        refilling.discard((section_id, kind))
+
+def _refill_done(task):
+    refill_tasks.discard(task)
+    if not task.cancelled() and task.exception():
+        logging.error(f"Question pool background refill failed: {task.exception()}")
+
+async def build_pools(document: str, language: str, chunks, collection: str = ""):
+    """Split an ingested document into sections and pre-generate MCQ and essay items for each."""
+    section_ids = []
+    for index, start in enumerate(range(0, len(chunks), QUESTION_POOL_SECTION_CHUNKS)):
+        text = "\n\n".join(chunk.page_content for chunk in chunks[start:start + QUESTION_POOL_SECTION_CHUNKS])
+        vector = await embed_request(text[:2000])
+        if vector is None:
+            continue
+        section_ids.append(await asyncio.to_thread(question_pool.add_section, document, language, index, text, vector, collection))
+
+    logging.info(f"Question pool: created {len(section_ids)} sections for {document}")
+    for section_id in section_ids:
+        await refill_section(section_id, "mcq")
+        await refill_section(section_id, "essay")
+
+async def take_from_pool(kind: str, question: str, language: str, num_questions: int, collection=None):
+    """Return pre-generated items for a matching section of the collection, or None when the pool cannot serve the request."""
+    vector = await embed_request(question)
+    if vector is None:
+        return None
+    section_id, similarity = await asyncio.to_thread(question_pool.best_section, language, vector, collection or "")
+    if section_id is None or similarity < QUESTION_POOL_MATCH_THRESHOLD:
+        return None
+
+    items = await asyncio.to_thread(question_pool.claim_items, section_id, kind, num_questions)
+    remaining = await asyncio.to_thread(question_pool.unused_count, section_id, kind)
+    if remaining < QUESTION_POOL_LOW_WATERMARK:
+        task = asyncio.create_task(refill_section(section_id, kind))
+        refill_tasks.add(task)
+        task.add_done_callback(_refill_done)
+    if items is None:
+        return None
+
+    for i, item in enumerate(items, 1):
+        item["number"] = i
+    return {
+        "total_questions": len(items),
+        "questions": items,
+        "metadata": {"source": "pool", "pool_section": section_id, "similarity": round(similarity, 4)}
+    }
@@ -0,0 +1,52 @@
+import json
+import logging
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from core.config import REPLAY_CAPTURE_PATH
+
+# Fields describing the generation a chat call belongs to (kind, language, num_questions, ...).
+_tags = ContextVar("replay_tags", default={})
+_lock = threading.Lock()
+
+@contextmanager
+def tag(**fields):
+    """Describe the chat calls made inside this block for the replay corpus."""
+    token = _tags.set({**_tags.get(), **fields})
+    try:
+        yield
+    finally:
+        _tags.reset(token)
+
+def current_tags():
+    if not REPLAY_CAPTURE_PATH:
+        return None
+    tags = _tags.get()
+    return dict(tags) if "kind" in tags else None
+
+def new_generation_id() -> str:
+    return uuid.uuid4().hex[:12]
+
+def record(tags: dict, model: str, messages, format: str, options, content: str, final: dict, stopped: str = None):
+    """Append one captured Ollama response to REPLAY_CAPTURE_PATH as a JSON line."""
+    entry = {
+        "id": uuid.uuid4().hex[:12],
+        "captured_at": time.time(),
+        **tags,
+        "model": model,
+        "format": format or "text",
+        "options": options or {},
+        "prompt": messages[-1]["content"] if messages else "",
+        "content": content,
+        "prompt_eval_count": final.get("prompt_eval_count"),
+        "eval_count": final.get("eval_count"),
+        "total_duration": final.get("total_duration"),
+        "stopped": stopped
+    }
+    try:
+        with _lock, open(REPLAY_CAPTURE_PATH, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+    except OSError as e:
+        logging.warning(f"Could not write replay capture to {REPLAY_CAPTURE_PATH}: {e}")
@@ -0,0 +1,179 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+import numpy as np
+from core.dependencies import retriever_language
+from core.config import (
+    CACHE_PATH,
+    CACHE_TTL_SECONDS,
+    SEMANTIC_CACHE_ENABLED,
+    SEMANTIC_CACHE_THRESHOLD,
+    SEMANTIC_CACHE_MAX_ENTRIES,
+)
+
+SIMILARITY_BUCKETS = np.round(np.arange(0.5, 1.0001, 0.05), 2)
+
+class SemanticCache:
+    """Reuses results for reworded requests by cosine similarity of their embeddings.
+
+    Vectors live in one normalized float32 matrix per partition (kind, collection,
+    language, content version, question count, model) so a lookup is a
+    single matrix-vector product.
+    Results stay in SQLite and are only read on a hit. Content versions are bumped on
+    upload and delete, so a hit never serves questions built on older documents.
+    """
+
+    def __init__(self, path: str, threshold: float, max_entries: int, ttl_seconds: float):
+        self.path = path
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._conn = None
+        self._partitions = None
+        self.lookups = 0
+        self.hits = 0
+        self.similarity_counts = np.zeros(len(SIMILARITY_BUCKETS) + 1, dtype=np.int64)
+
+    def _connection(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS semantic_cache (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    partition TEXT NOT NULL,
+                    vector BLOB NOT NULL,
+                    value TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                )
+            """)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS content_versions (
+                    scope TEXT PRIMARY KEY,
+                    version INTEGER NOT NULL
+                )
+            """)
+        return self._conn
+
+    @staticmethod
+    def _scope(collection, language) -> str:
+        return f"{collection or 'default'}|{retriever_language(language)}"
+
+    def content_version(self, collection, language) -> int:
+        """Version of the documents a (collection, language) request retrieves from; shared by all workers."""
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT version FROM content_versions WHERE scope = ?", (self._scope(collection, language),)
+            ).fetchone()
+        return row[0] if row else 0
+
+    def bump_version(self, collection, language):
+        """Called on upload and delete. Requests without a collection retrieve from every file, so "default" moves too."""
+        scopes = {self._scope(collection, language), self._scope(None, language)}
+        with self._lock:
+            conn = self._connection()
+            conn.executemany(
+                """INSERT INTO content_versions (scope, version) VALUES (?, 1)
+                   ON CONFLICT(scope) DO UPDATE SET version = version + 1""",
+                [(scope,) for scope in scopes]
+            )
+            conn.commit()
+
+    def _load(self):
+        if self._partitions is not None:
+            return
+        self._partitions = {}
+        cutoff = time.time() - self.ttl_seconds if self.ttl_seconds else 0
+        conn = self._connection()
+        conn.execute("DELETE FROM semantic_cache WHERE created_at < ?", (cutoff,))
+        conn.commit()
+        rows = conn.execute("SELECT id, partition, vector, created_at FROM semantic_cache ORDER BY id").fetchall()
+        for row_id, partition, blob, created_at in rows:
+            self._append(partition, row_id, np.frombuffer(blob, dtype=np.float32), created_at)
+        logging.info(f"Loaded {len(rows)} semantic cache entries")
+
+    def _append(self, partition, row_id, vector, created_at):
+        entry = self._partitions.setdefault(partition, {
+            "ids": np.empty(0, dtype=np.int64),
+            "created": np.empty(0, dtype=np.float64),
+            "vectors": np.empty((0, vector.shape[0]), dtype=np.float32)
+        })
+        if entry["vectors"].shape[1] != vector.shape[0]:
+            return
+        entry["ids"] = np.append(entry["ids"], row_id)
+        entry["created"] = np.append(entry["created"], created_at)
+        entry["vectors"] = np.vstack([entry["vectors"], vector[None, :]])
+
+    @staticmethod
+    def normalize(embedding):
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _record_similarity(self, similarity: float):
+        self.similarity_counts[np.searchsorted(SIMILARITY_BUCKETS, similarity, side="right")] += 1
+
+    def search(self, partition: str, vector):
+        with self._lock:
+            self._load()
+            self.lookups += 1
+            entry = self._partitions.get(partition)
+            if entry is None or not len(entry["ids"]) or entry["vectors"].shape[1] != vector.shape[0]:
+                return None
+
+            similarities = entry["vectors"] @ vector
+            if self.ttl_seconds:
+                similarities[entry["created"] < time.time() - self.ttl_seconds] = -1.0
+            best = int(np.argmax(similarities))
+            similarity = float(similarities[best])
+            self._record_similarity(similarity)
+            if similarity < self.threshold:
+                return None
+
+            row = self._connection().execute("SELECT value FROM semantic_cache WHERE id = ?", (int(entry["ids"][best]),)).fetchone()
+            if row is None:
+                return None
+            self.hits += 1
+        return json.loads(row[0]), similarity
+
+    def add(self, partition: str, vector, value):
+        now = time.time()
+        with self._lock:
+            self._load()
+            conn = self._connection()
+            cursor = conn.execute(
+                "INSERT INTO semantic_cache (partition, vector, value, created_at) VALUES (?, ?, ?, ?)",
+                (partition, vector.astype(np.float32).tobytes(), json.dumps(value, ensure_ascii=False), now)
+            )
+            self._append(partition, cursor.lastrowid, vector, now)
+            self._evict(conn)
+            conn.commit()
+
+    def _evict(self, conn):
+        total = sum(len(entry["ids"]) for entry in self._partitions.values())
+        overflow = total - self.max_entries
+        if overflow <= 0:
+            return
+        oldest = np.sort(np.concatenate([entry["ids"] for entry in self._partitions.values()]))[:overflow]
+        conn.executemany("DELETE FROM semantic_cache WHERE id = ?", [(int(i),) for i in oldest])
+        for entry in self._partitions.values():
+            keep = ~np.isin(entry["ids"], oldest)
+            entry["ids"], entry["created"], entry["vectors"] = entry["ids"][keep], entry["created"][keep], entry["vectors"][keep]
+
+    def stats(self):
+        with self._lock:
+            entries = sum(len(entry["ids"]) for entry in (self._partitions or {}).values())
+            labels = ["<0.5"] + [f">={b:.2f}" for b in SIMILARITY_BUCKETS]
+            return {
+                "enabled": SEMANTIC_CACHE_ENABLED,
+                "threshold": self.threshold,
+                "entries": entries,
+                "lookups": self.lookups,
+                "hits": self.hits,
+                "hit_rate": self.hits / self.lookups if self.lookups else 0.0,
+                "similarity_distribution": dict(zip(labels, self.similarity_counts.tolist()))
+            }
+
+semantic_cache = SemanticCache(CACHE_PATH, SEMANTIC_CACHE_THRESHOLD, SEMANTIC_CACHE_MAX_ENTRIES, CACHE_TTL_SECONDS)
@@ -0,0 +1,39 @@
+import asyncio
+import copy
+
+class SingleFlight:
+    """Runs at most one call per key; concurrent callers with the same key share its result.
+
+    The underlying call is shielded from individual callers being cancelled and is
+    only cancelled once every caller waiting on it has gone away.
+    """
+
+    def __init__(self):
+        self._calls = {}
+
+    async def do(self, key: str, producer):
+        call = self._calls.get(key)
+        if call is None:
+            call = {"task": asyncio.ensure_future(producer()), "waiters": 0, "refs": 0}
+            self._calls[key] = call
+            call["task"].add_done_callback(lambda _: self._forget(key, call))
+        else:
+            call["waiters"] += 1
+
+        call["refs"] += 1
+        try:
+            result = await asyncio.shield(call["task"])
+        except asyncio.CancelledError:
+            if call["refs"] == 1 and not call["task"].done():
+                call["task"].cancel()
+            raise
+        finally:
+            call["refs"] -= 1
+        return copy.deepcopy(result), call["waiters"]
+
+    def _forget(self, key, call):
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+    def in_flight(self) -> int:
+        return len(self._calls)
@@ -0,0 +1,60 @@
+import asyncio
+import logging
+import time
+from core.config import STARTUP_WARMUP, STARTUP_RETRY_SECONDS, VECTOR_REFRESH_SECONDS
+from core.dependencies import get_graph, get_vector_retriever_for, refresh_vector_retriever, RETRIEVER_DATABASES
+from services import ollama_client
+from services.neo4j_operations import ensure_schema
+
+def _neo4j_schema():
+    for language in RETRIEVER_DATABASES:
+        ensure_schema(get_graph(language))
+
+def _vector_indexes():
+    # Builds every language's retriever, which creates their vector and fulltext indexes if missing.
+    for language in RETRIEVER_DATABASES:
+        get_vector_retriever_for(language)
+
+STEPS = [
+    ("neo4j_schema", lambda: asyncio.to_thread(_neo4j_schema)),
+    ("vector_indexes", lambda: asyncio.to_thread(_vector_indexes)),
+    ("ollama_models", ollama_client.warm_up),
+]
+
+readiness = {"ready": not STARTUP_WARMUP, "started_at": time.time(), "steps": {}}
+
+async def warm_up():
+    """Run every startup step once, retrying failed ones until all succeed; readiness flips only then."""
+    pending = [name for name, _ in STEPS]
+    while pending:
+        for name, step in STEPS:
+            if name not in pending:
+                continue
+            started = time.monotonic()
+            try:
+                await step()
+            except Exception as e:
+                readiness["steps"][name] = {"ok": False, "error": str(e)}
+                logging.warning(f"Startup step {name} failed, retrying in {STARTUP_RETRY_SECONDS:.0f}s: {e}")
+                continue
+            readiness["steps"][name] = {"ok": True, "seconds": round(time.monotonic() - started, 3)}
+            pending.remove(name)
+            logging.info(f"Startup step {name} finished in {readiness['steps'][name]['seconds']}s")
+        if pending:
+            await asyncio.sleep(STARTUP_RETRY_SECONDS)
+    readiness["ready"] = True
+    readiness["ready_at"] = time.time()
+    logging.info(f"Ready after {readiness['ready_at'] - readiness['started_at']:.1f}s")
+
+async def refresh_retrievers():
+    """Embed chunks whose ingest worker stopped before embedding them, every VECTOR_REFRESH_SECONDS."""
+    while True:
+        await asyncio.sleep(VECTOR_REFRESH_SECONDS)
+        for language in RETRIEVER_DATABASES:
+            try:
+                embedded = await asyncio.to_thread(refresh_vector_retriever, language)
+            except Exception as e:
+                logging.warning(f"Refreshing the {language} retriever failed: {e}")
+                continue
+            if embedded:
+                logging.info(f"Embedded {embedded} chunks missing from the {language} retriever")
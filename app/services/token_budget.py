@@ -0,0 +1,146 @@
+import logging
+import math
+import re
+import threading
+import time
+from collections import deque
+from core import metrics
+from core.config import (
+    OLLAMA_NUM_CTX,
+    OLLAMA_MODEL_NUM_CTX,
+    CHARS_PER_TOKEN,
+    TOKEN_SAFETY_MARGIN,
+    OUTPUT_TOKEN_HEADROOM,
+    OUTPUT_STATS_MIN_SAMPLES,
+    OUTPUT_STATS_WINDOW,
+    ANSWER_OUTPUT_TOKENS,
+)
+
+# Rough output size of one parsed item, used until observed statistics exist.
+TOKENS_PER_ITEM = {"mcq": 120, "essay": 350}
+OUTPUT_OVERHEAD_TOKENS = 64
+
+# Observed output tokens per parsed item over the last OUTPUT_STATS_WINDOW responses, per kind.
+_item_stats = {}
+_stats_lock = threading.Lock()
+
+def count_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+def context_window(model: str) -> int:
+    return OLLAMA_MODEL_NUM_CTX.get(model, OLLAMA_NUM_CTX)
+
+def observe_output(kind: str, output_tokens: int, items: int):
+    if not items or not output_tokens:
+        return
+    with _stats_lock:
+        _item_stats.setdefault(kind, deque(maxlen=OUTPUT_STATS_WINDOW)).append(output_tokens / items)
+
+def _percentile(values, fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, math.ceil(fraction * len(ordered)) - 1)]
+
+def tokens_per_item(kind: str) -> float:
+    """p95 of the observed tokens per item once there are enough samples, else the static estimate.
+
+    A mean would truncate every response longer than average; num_predict is a hard stop.
+    """
+    with _stats_lock:
+        ratios = list(_item_stats.get(kind, ()))
+    if len(ratios) >= OUTPUT_STATS_MIN_SAMPLES:
+        return _percentile(ratios, 0.95)
+    return TOKENS_PER_ITEM.get(kind, TOKENS_PER_ITEM["mcq"])
+
+def expected_output_tokens(kind: str, num_questions: int) -> int:
+    return math.ceil(tokens_per_item(kind) * OUTPUT_TOKEN_HEADROOM * num_questions) + OUTPUT_OVERHEAD_TOKENS
+
+def output_stats():
+    with _stats_lock:
+        observed = {kind: list(ratios) for kind, ratios in _item_stats.items()}
+    stats = {}
+    for kind in TOKENS_PER_ITEM:
+        ratios = observed.get(kind)
+        stats[kind] = {
+            "tokens_per_item": tokens_per_item(kind),
+            "observed": {
+                "samples": len(ratios),
+                "mean_tokens_per_item": sum(ratios) / len(ratios),
+                "p95_tokens_per_item": _percentile(ratios, 0.95),
+                "max_tokens_per_item": max(ratios)
+            } if ratios else None
+        }
+    return stats
+
+def rank_chunks(question: str, chunks):
+    """Order chunk indices by word overlap with the question, keeping retrieval order on ties."""
+    terms = set(re.findall(r'\w+', question.lower()))
+
+    def score(index):
+        words = re.findall(r'\w+', chunks[index].lower())
+        if not words:
+            return 0.0
+        return sum(1 for w in words if w in terms) / math.sqrt(len(words))
+
+    return sorted(range(len(chunks)), key=lambda i: (-score(i), i))
+
+def fit_prompt(model: str, render, question: str, context: str, kind: str, num_questions=None):
+    """Render a prompt whose context is trimmed so prompt plus expected output fit in num_ctx.
+
+    render maps a context string to the full prompt. Returns the prompt, the Ollama
+    options to send (num_ctx and num_predict) and the budget for later comparison.
+    Without num_questions (free-form answers) the output budget is ANSWER_OUTPUT_TOKENS.
+    """
+    started = time.perf_counter()
+    num_ctx = context_window(model)
+    output_tokens = ANSWER_OUTPUT_TOKENS if num_questions is None else expected_output_tokens(kind, num_questions)
+    num_predict = min(output_tokens, num_ctx // 2)
+    available = num_ctx - num_predict - TOKEN_SAFETY_MARGIN
+
+    prompt = render(context)
+    chunks = [c for c in context.split("\n\n") if c.strip()]
+    dropped = 0
+    if count_tokens(prompt) > available and chunks:
+        kept = []
+        for index in rank_chunks(question, chunks):
+            candidate = sorted(kept + [index])
+            if count_tokens(render("\n\n".join(chunks[i] for i in candidate))) <= available:
+                kept = candidate
+        if not kept:
+            # Not even the best chunk fits whole; keep as much of it as the window allows.
+            overhead = count_tokens(render(""))
+            copies = max(1, render("\0").count("\0"))
+            best = chunks[rank_chunks(question, chunks)[0]]
+            prompt = render(best[:int(max(0, available - overhead) / copies * CHARS_PER_TOKEN)])
+        else:
+            prompt = render("\n\n".join(chunks[i] for i in kept))
+        dropped = len(chunks) - len(kept)
+        metrics.increment("context_chunks_trimmed_total", dropped, kind=kind)
+        logging.info(f"Token budget: dropped {dropped} of {len(chunks)} context chunks to fit num_ctx={num_ctx}")
+
+    budget = {
+        "num_ctx": num_ctx,
+        "num_predict": num_predict,
+        "prompt_tokens": count_tokens(prompt),
+        "context_chunks_dropped": dropped
+    }
+    metrics.observe("stage_duration_seconds", time.perf_counter() - started, stage="prompt_build", kind=kind)
+    return prompt, {"num_ctx": num_ctx, "num_predict": num_predict}, budget
+
+def record_usage(kind: str, budget: dict, response, items: int = 0) -> dict:
+    """Compare Ollama's reported token counts with the budget and record both.
+
+    items is the number of questions parsed from the output; it feeds the
+    tokens-per-item statistics that size later output budgets.
+    """
+    actual = {
+        "prompt_tokens": response.get("prompt_eval_count", 0),
+        "output_tokens": response.get("eval_count", 0)
+    }
+    metrics.increment("tokens_budgeted_total", budget["prompt_tokens"], kind=kind, phase="prompt")
+    metrics.increment("tokens_budgeted_total", budget["num_predict"], kind=kind, phase="output")
+    metrics.increment("tokens_actual_total", actual["prompt_tokens"], kind=kind, phase="prompt")
+    metrics.increment("tokens_actual_total", actual["output_tokens"], kind=kind, phase="output")
+    if actual["output_tokens"] >= budget["num_predict"]:
+        metrics.increment("output_budget_exhausted_total", kind=kind)
+    observe_output(kind, actual["output_tokens"], items)
+    return {"budget": budget, "actual": actual}
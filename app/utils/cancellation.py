@@ -0,0 +1,49 @@
+import asyncio
+import logging
+import time
+from fastapi import HTTPException, Request
+from core import metrics
+from core.config import REQUEST_DEADLINE_SECONDS, DISCONNECT_POLL_INTERVAL
+
+async def cancel_on_disconnect(request: Request, coro, deadline: float = REQUEST_DEADLINE_SECONDS):
+    """Await coro, cancelling it (and the Ollama streams under it) if the client leaves or the deadline passes."""
+    task = asyncio.ensure_future(coro)
+    expires = time.monotonic() + deadline
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=min(DISCONNECT_POLL_INTERVAL, max(0.0, expires - time.monotonic())))
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                reason = "disconnect"
+                break
+            if time.monotonic() >= expires:
+                reason = "deadline"
+                break
+    except asyncio.CancelledError:
+        task.cancel()
+        raise
+
+    task.cancel()
+    try:
+        await task
+    except (asyncio.CancelledError, Exception):
+        pass
+    metrics.increment("requests_cancelled_total", reason=reason, path=request.url.path)
+    logging.info(f"Cancelled {request.url.path} after {reason}")
+    if reason == "deadline":
+        raise HTTPException(status_code=504, detail=f"Generation exceeded the {deadline:.0f}s request deadline.")
+    raise HTTPException(status_code=499, detail="Client closed request.")
+
+async def iterate_until(items, deadline: float = REQUEST_DEADLINE_SECONDS):
+    """Yield from an async iterator until it ends or the deadline passes; raises asyncio.TimeoutError on expiry."""
+    expires = time.monotonic() + deadline
+    try:
+        while True:
+            try:
+                item = await asyncio.wait_for(items.__anext__(), max(0.0, expires - time.monotonic()))
+            except StopAsyncIteration:
+                return
+            yield item
+    finally:
+        await items.aclose()
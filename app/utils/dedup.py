@@ -0,0 +1,118 @@
+import zlib
+from itertools import combinations
+import numpy as np
+from utils.helpers import normalize_question_text
+
+MERSENNE_PRIME = (1 << 61) - 1
+MAX_HASH = (1 << 32) - 1
+
+# Question templates ("Apa yang dimaksud dengan ...", "Which of the following ...") would
+# otherwise dominate the overlap of two short questions.
+STOPWORDS = frozenset("""
+    apa apakah yang dimaksud dengan adalah dari dan di ke pada dalam untuk ini itu manakah mana
+    siapa siapakah berapa berapakah bagaimana mengapa jelaskan sebutkan merupakan contoh antara
+    atau oleh sebagai the a an of to in on for and or is are was what which who whom how why
+    does do did explain describe following these this that with by as be it its
+""".split())
+
+def shingles(text: str, k: int = 3):
+    """Character k-grams of the content words; rewordings keep most of them, word endings included."""
+    words = normalize_question_text(text).split()
+    words = [w for w in words if w not in STOPWORDS] or words
+    joined = " ".join(words)
+    if len(joined) < k:
+        return {joined} if joined else set()
+    return {joined[i:i + k] for i in range(len(joined) - k + 1)}
+
+def minhash_signatures(texts, num_perm: int = 120, k: int = 3, seed: int = 1):
+    """One MinHash signature row per text, computed with vectorized universal hashing."""
+    rng = np.random.RandomState(seed)
+    a = rng.randint(1, MAX_HASH, size=num_perm, dtype=np.uint64)
+    b = rng.randint(0, MAX_HASH, size=num_perm, dtype=np.uint64)
+    signatures = np.full((len(texts), num_perm), MAX_HASH, dtype=np.uint64)
+    for row, text in enumerate(texts):
+        hashes = np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingles(text, k)), dtype=np.uint64)
+        if hashes.size:
+            permuted = (np.outer(hashes, a) + b) % MERSENNE_PRIME & MAX_HASH
+            signatures[row] = permuted.min(axis=0)
+    return signatures
+
+def lsh_candidate_pairs(signatures, bands: int = 40, skip=()):
+    """Every pair of rows that shares at least one identical band of their signatures.
+
+    Rows in skip (texts without shingles) never become candidates.
+    """
+    rows_per_band = signatures.shape[1] // bands
+    pairs = set()
+    for band in range(bands):
+        buckets = {}
+        chunk = np.ascontiguousarray(signatures[:, band * rows_per_band:(band + 1) * rows_per_band])
+        for row in range(chunk.shape[0]):
+            if row not in skip:
+                buckets.setdefault(chunk[row].tobytes(), []).append(row)
+        for members in buckets.values():
+            if len(members) > 1:
+                pairs.update(combinations(members, 2))
+    return pairs
+
+class UnionFind:
+    def __init__(self, size: int):
+        self.parent = list(range(size))
+
+    def find(self, x: int) -> int:
+        while self.parent[x] != x:
+            self.parent[x] = self.parent[self.parent[x]]
+            x = self.parent[x]
+        return x
+
+    def union(self, x: int, y: int):
+        rx, ry = self.find(x), self.find(y)
+        if rx != ry:
+            self.parent[max(rx, ry)] = min(rx, ry)
+
+    def clusters(self):
+        groups = {}
+        for x in range(len(self.parent)):
+            groups.setdefault(self.find(x), []).append(x)
+        return [members for members in groups.values() if len(members) > 1]
+
+def cosine_pairs(embeddings, threshold: float, block_size: int = 1024):
+    """Pairs whose embedding cosine similarity is at least threshold, computed block by block."""
+    matrix = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    matrix = matrix / np.where(norms == 0, 1, norms)
+    for start in range(0, matrix.shape[0], block_size):
+        similarities = matrix[start:start + block_size] @ matrix.T
+        rows, cols = np.nonzero(similarities >= threshold)
+        rows = rows + start
+        keep = cols > rows
+        yield from zip(rows[keep].tolist(), cols[keep].tolist())
+
+def find_duplicate_clusters(texts, threshold: float = 0.8, num_perm: int = 120, bands: int = 40,
+                            embeddings=None, cosine_threshold: float = 0.92):
+    """Group near-duplicate texts; returns lists of indices, earliest index first.
+
+    Empty texts (or texts of stopwords only) are never clustered. With 40 bands of
+    3 rows, pairs at the default threshold become candidates with probability > 0.99.
+    """
+    union_find = UnionFind(len(texts))
+    if len(texts) > 1:
+        empty = {i for i, text in enumerate(texts) if not shingles(text)}
+        signatures = minhash_signatures(texts, num_perm=num_perm)
+        for i, j in lsh_candidate_pairs(signatures, bands=bands, skip=empty):
+            if np.mean(signatures[i] == signatures[j]) >= threshold:
+                union_find.union(i, j)
+        if embeddings is not None:
+            for i, j in cosine_pairs(embeddings, cosine_threshold):
+                if i not in empty and j not in empty:
+                    union_find.union(i, j)
+    return union_find.clusters()
+
+def dedupe_questions(questions, threshold: float = 0.8, embeddings=None):
+    """Keep the first question of every near-duplicate cluster and renumber the rest."""
+    clusters = find_duplicate_clusters([q["question"] for q in questions], threshold=threshold, embeddings=embeddings)
+    dropped = {index for cluster in clusters for index in cluster[1:]}
+    kept = [q for index, q in enumerate(questions) if index not in dropped]
+    for i, q in enumerate(kept, 1):
+        q["number"] = i
+    return kept, clusters
@@ -0,0 +1,79 @@
+import os
+import re
+import anyio
+from starlette.responses import FileResponse
+from starlette.types import Receive, Scope, Send
+
+RANGE_HEADER = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+def parse_range(header: str, size: int):
+    """(start, end) inclusive for a single "bytes=" range, or None to serve the whole file.
+
+    Multi-range and malformed headers fall back to the whole file, which RFC 9110 allows;
+    a well-formed range that starts past the end raises RangeNotSatisfiable.
+    """
+    match = RANGE_HEADER.match(header.strip()) if header else None
+    if not match or match.group(1) == match.group(2) == "":
+        return None
+    first, last = match.groups()
+    if first == "":
+        start, end = max(0, size - int(last)), size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+        if start > end:
+            if start < size:
+                return None
+            raise RangeNotSatisfiable()
+    if start >= size or size == 0:
+        raise RangeNotSatisfiable()
+    return start, end
+
+class RangeFileResponse(FileResponse):
+    """FileResponse for one byte range of a file (the whole file by default).
+
+    Uses the ASGI zero-copy send extension when the server offers it; otherwise
+    reads the range from disk in chunk_size pieces.
+    """
+
+    chunk_size = 256 * 1024
+
+    def __init__(self, path, start: int, end: int, size: int, **kwargs):
+        super().__init__(path, stat_result=os.stat(path), **kwargs)
+        self.start, self.end = start, end
+        if (start, end) != (0, size - 1):
+            self.status_code = 206
+            self.headers["content-range"] = f"bytes {start}-{end}/{size}"
+        self.headers["content-length"] = str(end - start + 1)
+        self.headers["accept-ranges"] = "bytes"
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        remaining = self.end - self.start + 1
+        if self.send_header_only or remaining <= 0:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+        elif "http.response.zerocopysend" in scope.get("extensions", {}):
+            with open(self.path, "rb") as file:
+                await send({
+                    "type": "http.response.zerocopysend",
+                    "file": file.fileno(),
+                    "offset": self.start,
+                    "count": remaining,
+                    "more_body": False,
+                })
+        else:
+            async with await anyio.open_file(self.path, mode="rb") as file:
+                await file.seek(self.start)
+                while remaining > 0:
+                    chunk = await file.read(min(self.chunk_size, remaining))
+                    if not chunk:
+                        break
+                    remaining -= len(chunk)
+                    await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+                if remaining > 0:
+                    await send({"type": "http.response.body", "body": b"", "more_body": False})
+        if self.background is not None:
+            await self.background()
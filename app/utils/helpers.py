@@ -1,4 +1,68 @@
+import json
+import os
+import re
+from core.config import UPLOAD_DIR
+
 def is_mcq_request(question_text):
     mcq_keywords = ['soal', 'pilihan ganda', 'mcq', 'multiple choice', 'pertanyaan', 'questions', 'question']
     return any(keyword in question_text.lower() for keyword in mcq_keywords)
 
+def extract_num_questions(question_text, default=10):
+    num_match = re.search(r'(\d+)\s*(?:soal|pertanyaan|question)', question_text, re.IGNORECASE)
+    return int(num_match.group(1)) if num_match else default
+
+def with_num_questions(question_text, num_questions):
+    """Rewrite the requested question count, e.g. for a sub-batch of a larger request."""
+    pattern = r'(\d+)(\s*(?:soal|pertanyaan|question))'
+    if re.search(pattern, question_text, re.IGNORECASE):
+        return re.sub(pattern, lambda m: f"{num_questions}{m.group(2)}", question_text, count=1, flags=re.IGNORECASE)
+    return f"{question_text} ({num_questions} soal)"
+
+def split_context(context, parts):
+    """Deal retrieved chunks round-robin so every slice mixes high and low ranked chunks."""
+    chunks = [c for c in context.split("\n\n") if c.strip()]
+    if parts <= 1 or not chunks:
+        return [context] * max(parts, 1)
+    slices = [chunks[i::parts] or [chunks[i % len(chunks)]] for i in range(parts)]
+    return ["\n\n".join(s) for s in slices]
+
+def normalize_question_text(text):
+    return re.sub(r'\s+', ' ', re.sub(r'[^\w\s]', ' ', text.lower())).strip()
+
+def merge_question_sets(question_sets, limit=None):
+    """Concatenate parsed question sets, drop repeated questions and renumber."""
+    merged, seen = [], set()
+    for question_set in question_sets:
+        for q in question_set.get("questions", []):
+            key = normalize_question_text(q["question"])
+            if key in seen:
+                continue
+            seen.add(key)
+            merged.append(q)
+    if limit is not None:
+        merged = merged[:limit]
+    for i, q in enumerate(merged, 1):
+        q["number"] = i
+    return {
+        "total_questions": len(merged),
+        "questions": merged
+    }
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+def upload_key(name):
+    """Path of an uploaded file relative to UPLOAD_DIR, with forward slashes ("x.pdf", "indonesian/x.pdf").
+
+    The one key for a file in the graph (Document.source_file), the file catalog and on disk.
+    Accepts a key, a path under UPLOAD_DIR or a loader path; raises ValueError for names outside it.
+    """
+    path = os.path.normpath(str(name).replace("\\", "/"))
+    upload_dir = os.path.normpath(UPLOAD_DIR)
+    if os.path.isabs(path):
+        path = os.path.relpath(path, os.path.abspath(upload_dir))
+    elif path == upload_dir or path.startswith(upload_dir + os.sep):
+        path = os.path.relpath(path, upload_dir)
+    if path in (".", "") or path == ".." or path.startswith(".." + os.sep) or os.path.isabs(path):
+        raise ValueError(f"'{name}' is not a file under {UPLOAD_DIR}")
+    return path.replace(os.sep, "/")
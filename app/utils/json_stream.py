@@ -0,0 +1,65 @@
+import json
+import logging
+from pydantic import ValidationError
+
+class IncrementalJSONItemParser:
+    """Validates each object of a streamed JSON array as soon as its closing brace arrives.
+
+    Exposes the same feed/finish interface as IncrementalQuestionParser so the
+    streaming endpoints can use either one.
+    """
+
+    def __init__(self, item_model, kind: str):
+        self.item_model = item_model
+        self.kind = kind
+        self.text = ""
+        self.pos = 0
+        self.stack = []
+        self.in_string = False
+        self.escaped = False
+        self.item_start = None
+        self.item_depth = 0
+        self.count = 0
+        self.invalid = 0
+
+    def feed(self, text: str):
+        self.text += text
+        items = []
+        while self.pos < len(self.text):
+            ch = self.text[self.pos]
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif ch == "\\":
+                    self.escaped = True
+                elif ch == '"':
+                    self.in_string = False
+            elif ch == '"':
+                self.in_string = True
+            elif ch in "{[":
+                if ch == "{" and self.item_start is None and self.stack and self.stack[-1] == "[":
+                    self.item_start = self.pos
+                    self.item_depth = len(self.stack)
+                self.stack.append(ch)
+            elif ch in "}]" and self.stack:
+                self.stack.pop()
+                if ch == "}" and self.item_start is not None and len(self.stack) == self.item_depth:
+                    item = self._validate(self.text[self.item_start:self.pos + 1])
+                    self.item_start = None
+                    if item:
+                        items.append(item)
+            self.pos += 1
+        return items
+
+    def finish(self):
+        return []
+
+    def _validate(self, raw: str):
+        try:
+            item = self.item_model.model_validate(json.loads(raw))
+        except (ValueError, ValidationError) as e:
+            self.invalid += 1
+            logging.debug(f"Discarding invalid JSON item: {e}")
+            return None
+        self.count += 1
+        return {"number": self.count, **item.model_dump()}
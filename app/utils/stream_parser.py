@@ -0,0 +1,161 @@
+import re
+import time
+from core import metrics
+from utils.mcq_json import parse_single_question
+
+QUESTION_MARKER = re.compile(r'^(?:\*\*)?(?:Soal|Question)\s+\d+(?:\*\*)?[:\.]?(?:\*\*)?\s*', re.IGNORECASE)
+ANSWER_MARKER = re.compile(r'^(?:\*\*)?(?:Jawaban(?:\s+(?:yang\s+)?benar)?|(?:Correct\s+)?Answer)(?:\*\*)?\s*[:=]\s*(?:\*\*)?\s*', re.IGNORECASE)
+
+class IncrementalQuestionParser:
+    """Parses a token stream and returns each question as soon as it is complete.
+
+    An MCQ question is complete at its answer line; an essay question only at the
+    next question marker or the end of the stream, since its answer may span lines.
+    """
+
+    def __init__(self, kind: str = "mcq", language=None):
+        self.kind = kind
+        self.language = language
+        self.pending = ""
+        self.block = []
+        self.count = 0
+
+    def feed(self, text: str):
+        self.pending += text
+        items = []
+        while "\n" in self.pending:
+            line, self.pending = self.pending.split("\n", 1)
+            item = self._consume_line(line)
+            if item:
+                items.append(item)
+        return items
+
+    def finish(self):
+        items = []
+        if self.pending:
+            item = self._consume_line(self.pending)
+            self.pending = ""
+            if item:
+                items.append(item)
+        item = self._flush_block()
+        if item:
+            items.append(item)
+        return items
+
+    def _consume_line(self, line: str):
+        stripped = line.strip()
+        item = None
+        if QUESTION_MARKER.match(stripped) and self.block:
+            item = self._flush_block()
+        if self.kind == "essay":
+            # Essay answers run over several lines, so a block only ends at the next
+            # question marker or in finish(); raw lines keep the answer's line breaks.
+            if stripped or self.block:
+                self.block.append(line.rstrip())
+            return item
+        if stripped:
+            self.block.append(stripped)
+        if ANSWER_MARKER.match(stripped):
+            item = self._flush_block() or item
+        return item
+
+    def _flush_block(self):
+        if not self.block:
+            return None
+        lines, self.block = self.block, []
+        if self.kind == "essay":
+            item = self._parse_essay_block(lines)
+        else:
+            lines[0] = QUESTION_MARKER.sub('', lines[0])
+            item = parse_single_question("\n".join(lines), self.count + 1, self.language)
+        if item:
+            self.count += 1
+            item["number"] = self.count
+        return item
+
+    @staticmethod
+    def _parse_essay_block(lines):
+        question_lines, answer_lines = [], None
+        for line in lines:
+            if answer_lines is not None:
+                answer_lines.append(line)
+                continue
+            stripped = line.strip()
+            answer_match = ANSWER_MARKER.match(stripped)
+            if answer_match:
+                answer_lines = [stripped[answer_match.end():]]
+            else:
+                question_lines.append(QUESTION_MARKER.sub('', stripped))
+        question = " ".join(l for l in question_lines if l).strip()
+        answer = "\n".join(answer_lines or []).strip()
+        if not question or not answer:
+            return None
+        return {"number": 0, "question": question, "answer": answer}
+
+class ParsedStream:
+    """Runs an Ollama chunk stream through a parser and closes it once `limit` items are complete.
+
+    Closing the stream makes Ollama stop generating, so a model that keeps going after
+    the last requested question does not cost any more tokens. Essay items only complete
+    at the next question marker, so an essay stream is never cut inside an answer; its
+    length is bounded by num_predict. Items rejected by `accept` are dropped and do not count
+    towards `limit`; accepted items are renumbered. The raw text is kept in `content` for
+    callers that re-parse the full response.
+    """
+
+    def __init__(self, parser, limit: int, accept=None):
+        self.parser = parser
+        self.limit = limit
+        self.accept = accept
+        self.accepted = 0
+        self.content = ""
+        self.final = {}
+        self.chunks = 0
+        self.stopped_early = False
+        self.parse_seconds = 0.0
+
+    async def items(self, stream):
+        try:
+            async for chunk in stream:
+                if chunk.get('done'):
+                    self.final = chunk
+                else:
+                    self.chunks += 1
+                text = chunk['message']['content']
+                self.content += text
+                started = time.perf_counter()
+                items = self.parser.feed(text)
+                self.parse_seconds += time.perf_counter() - started
+                for item in self._accepted(items):
+                    yield item
+                    if self.accepted >= self.limit:
+                        self.stopped_early = not chunk.get('done')
+                        return
+            started = time.perf_counter()
+            items = self.parser.finish()
+            self.parse_seconds += time.perf_counter() - started
+            for item in self._accepted(items):
+                yield item
+        finally:
+            await stream.aclose()
+            # Only time spent inside the parser, not waiting on the model between chunks.
+            metrics.observe("stage_duration_seconds", self.parse_seconds, stage="parse", kind=self.parser.kind, format="stream")
+
+    def _accepted(self, items):
+        for item in items:
+            if self.accept is not None and not self.accept(item):
+                continue
+            self.accepted += 1
+            if "number" in item:
+                item["number"] = self.accepted
+            yield item
+
+    async def collect(self, stream):
+        return [item async for item in self.items(stream)]
+
+    def usage(self):
+        """Token counts in Ollama's response format; chunk count stands in for eval_count when stopped early."""
+        return {
+            "prompt_eval_count": self.final.get("prompt_eval_count", 0),
+            "eval_count": self.final.get("eval_count", self.chunks)
+        }
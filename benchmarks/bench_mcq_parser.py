@@ -0,0 +1,75 @@
+"""Throughput and yield of utils.mcq_json.parse_mcq_text over a corpus of LLM outputs.
+
+The default corpus, corpus/mcq_outputs.jsonl, is synthetic: hand-templated responses in the
+marker and answer variants the prompts ask for, marked "source": "synthetic". It measures
+parser speed and format coverage, not the yield of a real model. Run it on a capture made
+with REPLAY_CAPTURE_PATH (see replay.py) for real-world numbers.
+
+Usage: python benchmarks/bench_mcq_parser.py [--corpus PATH] [--repeat N]
+"""
+import argparse
+import contextlib
+import io
+import json
+import logging
+import os
+import sys
+import time
+from collections import defaultdict
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+from utils.mcq_json import parse_mcq_text  # noqa: E402
+
+DEFAULT_CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus", "mcq_outputs.jsonl")
+
+def load_corpus(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def run(entries, repeat):
+    # Parsers that print diagnostics would otherwise dominate the measurement with terminal I/O.
+    sink = io.StringIO()
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(sink):
+        for _ in range(repeat):
+            results = [parse_mcq_text(entry["content"], entry.get("language")) for entry in entries]
+    elapsed = time.perf_counter() - started
+    return results, elapsed, len(sink.getvalue())
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    entries = [e for e in load_corpus(args.corpus) if e.get("kind", "mcq") == "mcq"]
+    results, elapsed, stdout_bytes = run(entries, args.repeat)
+
+    by_language = defaultdict(lambda: {"responses": 0, "requested": 0, "parsed": 0, "correct_keys": 0})
+    for entry, result in zip(entries, results):
+        stats = by_language[entry.get("language", "unknown")]
+        stats["responses"] += 1
+        stats["requested"] += entry["num_questions"]
+        stats["parsed"] += result["total_questions"]
+        expected = entry.get("answers")
+        if expected:
+            stats["correct_keys"] += sum(1 for q, a in zip(result["questions"], expected) if q["answer"] == a)
+
+    total_questions = sum(r["total_questions"] for r in results) * args.repeat
+    total_bytes = sum(len(e["content"].encode("utf-8")) for e in entries) * args.repeat
+    synthetic = sum(1 for e in entries if e.get("source") == "synthetic")
+    print(f"corpus: {len(entries)} responses ({synthetic} synthetic), {sum(e['num_questions'] for e in entries)} requested questions")
+    print(f"time: {elapsed:.3f}s for {args.repeat} passes")
+    print(f"throughput: {len(entries) * args.repeat / elapsed:.1f} responses/s, "
+          f"{total_questions / elapsed:.1f} questions/s, {total_bytes / elapsed / 1e6:.2f} MB/s")
+    print(f"stdout written by parser: {stdout_bytes / args.repeat:.0f} bytes per pass")
+    for language, stats in sorted(by_language.items()):
+        line = f"{language}: yield {stats['parsed']}/{stats['requested']} ({stats['parsed'] / max(1, stats['requested']):.1%})"
+        if stats["correct_keys"] or any(e.get("answers") for e in entries if e.get("language") == language):
+            line += f", answer keys correct {stats['correct_keys']}/{stats['parsed']}"
+        print(line)
+
+if __name__ == "__main__":
+    main()
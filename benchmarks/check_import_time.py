@@ -0,0 +1,84 @@
+"""Import-time budget: importing app/main.py must stay under a budget for every worker role.
+
+Each role is imported in a fresh interpreter, as a forked or newly started worker would.
+Also fails when a role pulls in a module that should only load on first use.
+
+Usage: python benchmarks/check_import_time.py [--budget SECONDS] [--runs N] [--top N]
+Exits non-zero when any role exceeds the budget or imports a forbidden module.
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app")
+
+# Heavy packages that only ingestion (or the first retrieval) should import.
+LAZY_MODULES = [
+    "langchain",
+    "langchain_community",
+    "langchain_experimental",
+    "langchain_ollama",
+    "langchain_neo4j",
+    "pypdf",
+]
+
+PROBE = """
+import sys, time
+started = time.perf_counter()
+import main
+elapsed = time.perf_counter() - started
+loaded = sorted({name.split('.')[0] for name in sys.modules} & set(sys.argv[1:]))
+print(elapsed)
+print(','.join(loaded))
+"""
+
+def measure(role, runs):
+    env = {**os.environ, "WORKER_ROLE": role}
+    timings, loaded = [], ""
+    for _ in range(runs):
+        result = subprocess.run(
+            [sys.executable, "-c", PROBE, *LAZY_MODULES], cwd=APP_DIR, env=env, capture_output=True, text=True
+        )
+        if result.returncode != 0:
+            raise RuntimeError(f"importing main as role {role} failed:\n{result.stderr}")
+        lines = result.stdout.splitlines()
+        timings.append(float(lines[0]))
+        loaded = lines[1] if len(lines) > 1 else ""
+    return min(timings), [name for name in loaded.split(",") if name]
+
+def slowest_imports(role, top):
+    """Cumulative per-module import times from -X importtime, slowest first."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=APP_DIR, env={**os.environ, "WORKER_ROLE": role}, capture_output=True, text=True
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append((int(cumulative_us), name.strip()))
+    return sorted(rows, reverse=True)[:top]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--budget", type=float, default=1.5, help="seconds per role (best of --runs)")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--top", type=int, default=8)
+    args = parser.parse_args()
+
+    failures = 0
+    for role in ("query", "ingest", "all"):
+        elapsed, loaded = measure(role, args.runs)
+        status = "ok" if elapsed <= args.budget and not loaded else "FAIL"
+        failures += status == "FAIL"
+        print(f"{status} {role}: {elapsed:.3f}s (budget {args.budget:.2f}s)")
+        if loaded:
+            print(f"  imported eagerly: {', '.join(loaded)}")
+        for cumulative_us, name in slowest_imports(role, args.top):
+            print(f"  {cumulative_us / 1000:8.1f} ms  {name}")
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""End-to-end check: a chunk ingested through ingest_documents comes back from get_vector_retriever_for.
+
+Needs the configured Neo4j and Ollama. Ingests one synthetic chunk carrying a unique
+marker into the language's database, retrieves it by its own text and deletes it again.
+
+Usage: python benchmarks/check_ingest_retrieval.py [--language indonesian|english]
+Exits non-zero when the chunk is not retrieved.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import uuid
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app")
+sys.path.insert(0, APP_DIR)
+# UPLOAD_DIR is relative to the app directory, like when the API runs.
+os.chdir(APP_DIR)
+
+from core.dependencies import get_graph, get_vector_retriever_for, close_graph  # noqa: E402
+from services.neo4j_operations import delete_data_from_neo4j, collect_orphan_entities  # noqa: E402
+from services.pdf_processing import ingest_documents, tag_chunks  # noqa: E402
+
+async def check(language: str) -> bool:
+    from langchain_core.documents import Document
+    marker = f"retrievalcheck{uuid.uuid4().hex[:12]}"
+    text = f"{marker}: fotosintesis mengubah energi cahaya menjadi energi kimia di kloroplas ({marker})."
+    filename = f"{marker}.pdf"
+    chunks = tag_chunks([Document(page_content=text, metadata={"source": filename})], filename)
+    graph = await asyncio.to_thread(get_graph, language)
+    try:
+        stored = await ingest_documents(chunks, graph, language)
+        retriever = await asyncio.to_thread(get_vector_retriever_for, language)
+        docs = await retriever.ainvoke(text)
+        found = any(marker in doc.page_content for doc in docs)
+        print(f"{'ok' if found else 'FAIL'} {language}: stored {stored} chunk(s), retrieved {len(docs)}, marker {'found' if found else 'missing'}")
+        return found
+    finally:
+        counts = await asyncio.to_thread(delete_data_from_neo4j, filename, graph)
+        await asyncio.to_thread(collect_orphan_entities, counts["mentioned_entities"], graph, filename)
+        print(f"  cleaned up {counts['nodes_deleted']} chunk(s)")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--language", default="indonesian")
+    args = parser.parse_args()
+    try:
+        ok = asyncio.run(check(args.language.lower()))
+    finally:
+        close_graph()
+    sys.exit(0 if ok else 1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+"""Regression check: every corpus entry must parse to its expected number of questions and answer keys.
+
+Both default corpora are synthetic: templated or hand-written responses, not recorded model output.
+
+Usage: python benchmarks/check_mcq_corpus.py [CORPUS ...]
+Exits non-zero when any entry regresses.
+"""
+import json
+import logging
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+from utils.mcq_json import parse_mcq_text  # noqa: E402
+
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus")
+DEFAULT_CORPORA = [os.path.join(CORPUS_DIR, name) for name in ("mcq_outputs.jsonl", "mcq_regression.jsonl")]
+
+def check(entry):
+    result = parse_mcq_text(entry["content"], entry.get("language"))
+    answers = [q["answer"] for q in result["questions"]]
+    expected = entry.get("answers")
+    if result["total_questions"] != entry["num_questions"]:
+        return f"parsed {result['total_questions']} of {entry['num_questions']} questions"
+    if expected and answers != expected:
+        wrong = [i + 1 for i, (got, want) in enumerate(zip(answers, expected)) if got != want]
+        return f"wrong answer keys for questions {wrong}"
+    return None
+
+def main():
+    logging.disable(logging.WARNING)
+    failures, total = 0, 0
+    for path in sys.argv[1:] or DEFAULT_CORPORA:
+        with open(path, encoding="utf-8") as f:
+            entries = [json.loads(line) for line in f if line.strip()]
+        for entry in entries:
+            if entry.get("kind", "mcq") != "mcq":
+                continue
+            total += 1
+            problem = check(entry)
+            if problem:
+                failures += 1
+                print(f"FAIL {os.path.basename(path)}:{entry['id']} ({entry.get('language')}): {problem}")
+    print(f"{total - failures}/{total} corpus entries parse as expected")
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
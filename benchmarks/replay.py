@@ -0,0 +1,113 @@
+"""Replay recorded Ollama responses through the service parsers, offline.
+
+Capture a corpus by running the API with REPLAY_CAPTURE_PATH=benchmarks/corpus/captured.jsonl;
+every tagged chat call made by LLMService and EssayService is appended as one JSON line.
+The corpora committed in benchmarks/corpus are synthetic ("source": "synthetic", no
+captured_at); they replay the same way but say nothing about a real model's yield.
+
+Usage: python benchmarks/replay.py [CORPUS ...] [--repeat N]
+
+Reports, per kind and language: parse throughput, yield (parsed versus requested
+questions), which parse path each response took (JSON, JSON falling back to the
+text parser, text, text after the repair pass), the share of responses that came
+up short and would trigger a retry, and the retry rate actually recorded in the capture.
+"""
+import argparse
+import contextlib
+import io
+import json
+import logging
+import os
+import sys
+import time
+from collections import defaultdict
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+from models.schemas import MCQItem, EssayItem  # noqa: E402
+from services.essay_services import EssayService  # noqa: E402
+from services.llm_services import LLMService  # noqa: E402
+from utils.json_stream import IncrementalJSONItemParser  # noqa: E402
+from utils.mcq_json import parse_mcq_text  # noqa: E402
+
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus")
+
+def load(paths):
+    entries = []
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            entries.extend(json.loads(line) for line in f if line.strip())
+    return entries
+
+def replay_entry(entry):
+    """Parse one response the way the service would; returns (parsed count, path)."""
+    kind, language = entry.get("kind", "mcq"), entry.get("language")
+    requested = entry["num_questions"]
+    content = entry["content"]
+
+    if entry.get("format") == "json":
+        parser = IncrementalJSONItemParser(MCQItem if kind == "mcq" else EssayItem, kind)
+        items = parser.feed(content)
+        if kind == "essay":
+            items = [q for q in items if not EssayService.is_multiple_choice(q)]
+        if not items:
+            return 0, "json_fallback"
+        return len(items), "json" if len(items) >= requested else "json_partial"
+
+    if kind == "essay":
+        questions = EssayService.parse_essay_text(content, requested)["questions"]
+        return len([q for q in questions if not EssayService.is_multiple_choice(q)]), "text"
+
+    parsed = parse_mcq_text(content, language)
+    if parsed["total_questions"] >= requested:
+        return parsed["total_questions"], "text"
+    repaired = parse_mcq_text(LLMService.enhance_content_format(content), language)
+    return repaired["total_questions"], "text_repair"
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("corpus", nargs="*")
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    paths = args.corpus or [
+        os.path.join(CORPUS_DIR, name) for name in sorted(os.listdir(CORPUS_DIR)) if name.endswith(".jsonl")
+    ]
+    entries = load(paths)
+    groups = defaultdict(list)
+    for entry in entries:
+        groups[(entry.get("kind", "mcq"), entry.get("language") or "unspecified")].append(entry)
+
+    synthetic = sum(1 for e in entries if e.get("source") == "synthetic" or "captured_at" not in e)
+    print(f"replaying {len(entries)} responses ({synthetic} synthetic) from {len(paths)} corpus file(s), {args.repeat} passes")
+    for (kind, language), group in sorted(groups.items()):
+        sink = io.StringIO()
+        started = time.perf_counter()
+        with contextlib.redirect_stdout(sink):
+            for _ in range(args.repeat):
+                results = [replay_entry(entry) for entry in group]
+        elapsed = time.perf_counter() - started
+
+        requested = sum(e["num_questions"] for e in group)
+        parsed = sum(count for count, _ in results)
+        paths_taken = defaultdict(int)
+        for _, path in results:
+            paths_taken[path] += 1
+        short = sum(1 for e, (count, _) in zip(group, results) if count < e["num_questions"])
+        topups = sum(1 for e in group if e.get("attempt") == "topup")
+        first_passes = len(group) - topups
+        durations = [e["total_duration"] / 1e9 for e in group if e.get("total_duration")]
+
+        print(f"\n[{kind} / {language}] {len(group)} responses")
+        print(f"  throughput: {len(group) * args.repeat / elapsed:.1f} responses/s, {parsed * args.repeat / elapsed:.1f} questions/s")
+        print(f"  yield: {parsed}/{requested} ({parsed / max(1, requested):.1%})")
+        print("  paths: " + ", ".join(f"{path} {n} ({n / len(group):.0%})" for path, n in sorted(paths_taken.items())))
+        print(f"  short responses (would retry or repair): {short} ({short / len(group):.0%})")
+        if topups:
+            print(f"  recorded retry rate: {topups}/{first_passes} top-up calls per first pass")
+        if durations:
+            print(f"  recorded generation time: mean {sum(durations) / len(durations):.2f}s, max {max(durations):.2f}s")
+
+if __name__ == "__main__":
+    main()
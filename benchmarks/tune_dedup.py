@@ -0,0 +1,38 @@
+"""Recall and false merges of utils.dedup over labelled question pairs, per similarity threshold.
+
+The pairs in corpus/dedup/question_pairs.jsonl are hand-written: rewordings of the same exam
+question (duplicate) and same-template questions about a different fact (not duplicate).
+Add real pairs from generated question sets as they turn up.
+
+Usage: python benchmarks/tune_dedup.py [--corpus PATH] [--thresholds 0.4,0.5,...]
+"""
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+from utils.dedup import find_duplicate_clusters  # noqa: E402
+
+DEFAULT_CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus", "dedup", "question_pairs.jsonl")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS)
+    parser.add_argument("--thresholds", default="0.4,0.45,0.5,0.55,0.6,0.65,0.7,0.75,0.8,0.85")
+    args = parser.parse_args()
+
+    with open(args.corpus, encoding="utf-8") as f:
+        pairs = [json.loads(line) for line in f if line.strip()]
+    duplicates = sum(1 for p in pairs if p["duplicate"])
+    print(f"{len(pairs)} pairs: {duplicates} duplicates, {len(pairs) - duplicates} distinct")
+    for threshold in (float(t) for t in args.thresholds.split(",")):
+        found = [bool(find_duplicate_clusters([p["a"], p["b"]], threshold=threshold)) for p in pairs]
+        recall = sum(1 for p, hit in zip(pairs, found) if hit and p["duplicate"])
+        false_merges = sum(1 for p, hit in zip(pairs, found) if hit and not p["duplicate"])
+        print(f"threshold {threshold:.2f}: recall {recall}/{duplicates}, false merges {false_merges}/{len(pairs) - duplicates}")
+    print(f"empty texts clustered: {bool(find_duplicate_clusters(['', '', '?', 'Apa yang dimaksud?']))}")
+
+if __name__ == "__main__":
+    main()